@@ -1,17 +1,43 @@
 from datetime import datetime, timedelta
-from dataclasses import dataclass
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from dataclasses import astuple, dataclass
+from typing import List, Dict, Optional, Set, Tuple, Union
+from queue import Empty, Full, Queue
 from operator import getitem
-from functools import reduce
+from functools import reduce, wraps
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from threading import Lock, Thread
 from psycopg2 import sql
 from pathlib import Path
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from etherscan_client import ETHERSCAN_URL, EtherscanClient, TokenBucket, get_client
+from tx_store import TransactionStore, get_store
+from receipts import get_receipt_backend, received_tokens
+from metrics import metrics
+import argparse
 import psycopg2
+import socket
 import requests
 import schedule
 import yaml
 import json
+import heapq
 import time
+import os
+import re
+
+
+_MISSING = object()
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+LINK_KEYWORDS = re.compile(r't(?:witter\.com|elegram\.me|\.me)|http|\.io')
+NON_SPACE = re.compile(r'\S*')
+DEFAULT_CONCURRENCY = 5
+RECENT_TRANSFER_WINDOW = timedelta(hours=2, minutes=30)  # how far back the hot wallet's transfers are screened
+DEXSCREENER_URL = "https://api.dexscreener.com"
+TELEGRAM_URL = "https://api.telegram.org"
 
 
 @dataclass
@@ -25,40 +51,160 @@ class Config:
         with open(self.file_path, 'r') as file:
             return yaml.safe_load(file)
 
-    def get_value(self, key: str) -> str:
+    def get_value(self, key: str, default=_MISSING) -> str:
         """Get a nested value from the config file using a dot-separated string."""
-        return reduce(getitem, key.split('.'), self.data)
+        try:
+            return reduce(getitem, key.split('.'), self.data)
+        except (KeyError, TypeError):
+            if default is _MISSING:
+                raise
+            return default
 
 
 class TelegramAlert:
 
-    def __init__(self):
-        config = Config("credentials.yml")
+    def __init__(self, config: Optional[Config] = None, session=None):
+        config = config or Config("credentials.yml")
         self.token_id = config.get_value('Telegram.TOKEN_ID')
         self.chat_id = config.get_value('Telegram.CHAT_ID')
+        self.base_url = config.get_value('Telegram.BASE_URL', TELEGRAM_URL)
+        self.session = session or requests
 
-    def send_telegram_message(self, message):
-        """Sends message via Telegram"""
-
-        url = "https://api.telegram.org/bot" + self.token_id + "/sendMessage"
+    def post_message(self, message) -> dict:
+        """Send a message and return Telegram's decoded answer."""
+        url = self.base_url + "/bot" + self.token_id + "/sendMessage"
         data = {
             "chat_id": self.chat_id,
             "text": message
         }
 
+        with metrics.request('telegram', 'sendMessage'):
+            response = self.session.request("POST", url, params=data, timeout=30)
+        if response.status_code == 429:
+            metrics.inc('api_rate_limited_total', service='telegram', endpoint='sendMessage')
+        return json.loads(response.text)
+
+    def send_telegram_message(self, message):
+        """Sends message via Telegram"""
         try:
-            response = requests.request("POST", url, params=data)
-            telegram_data = json.loads(response.text)
-            return telegram_data["ok"]
+            return self.post_message(message)["ok"]
         except Exception as e:
             print("An error occurred in sending the alert message via Telegram")
             print(e)
         return False
 
 
+class ContractLinkCache:
+    """Permanent JSON cache of the links found in verified contract sources, keyed by contract address."""
+
+    def __init__(self, path: str = "contract_links.json"):
+        self.path = Path(path)
+        self.links = None
+        self.lock = Lock()
+
+    def _load(self):
+        try:
+            self.links = json.loads(self.path.read_text()) if self.path.exists() else {}
+        except (OSError, ValueError) as e:
+            # An unreadable cache only costs downloading the sources again
+            print(f"Ignoring the unreadable contract link cache {self.path}")
+            print(e)
+            self.links = {}
+
+    def get(self, contract_address: str) -> Optional[Dict[str, str]]:
+        with self.lock:
+            if self.links is None:
+                self._load()
+            return self.links.get(contract_address)
+
+    def set(self, contract_address: str, links: Dict[str, str]):
+        with self.lock:
+            if self.links is None:
+                self._load()
+            self.links[contract_address] = links
+            FileManager.write_to_file(str(self.path), self.links)
+
+
+contract_links = ContractLinkCache()
+
+
+class MarketData:
+    """Dexscreener token data, fetched for up to 30 tokens per request and kept for `ttl` seconds."""
+    BATCH_SIZE = 30
+
+    def __init__(self, base_url: str = DEXSCREENER_URL, ttl: float = 60):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.cache: Dict[str, Tuple[float, Optional[dict]]] = {}
+        self.lock = Lock()
+
+    @staticmethod
+    def parse(info: dict) -> Dict[str, str]:
+        return {"name": info['baseToken']['name'],
+                "symbol": info['baseToken']['symbol'],
+                "mc": CryptoInfo.format_number(info['fdv']),
+                "usd_price": info['priceUsd'],
+                "volume": CryptoInfo.format_number(info['volume']['h24']),
+                "priceChange": info['priceChange']['h24'],
+                "creation": info['pairCreatedAt']}
+
+    def fetch(self, addresses: List[str]) -> Dict[str, Optional[dict]]:
+        """Data of the first pair listed for each token, None for tokens without a pair."""
+        url = f"{self.base_url}/latest/dex/tokens/{','.join(addresses)}"
+        with metrics.request('dexscreener', 'tokens'):
+            response = requests.get(url)
+            if response.status_code == 429:
+                metrics.inc('api_rate_limited_total', service='dexscreener', endpoint='tokens')
+            response.raise_for_status()
+
+        infos = dict.fromkeys(addresses)
+        for pair in response.json().get('pairs') or []:
+            for side in ('baseToken', 'quoteToken'):
+                address = pair.get(side, {}).get('address', '').lower()
+                if address in infos and infos[address] is None:
+                    infos[address] = self.parse(pair)
+        return infos
+
+    def get_many(self, addresses: List[str]) -> Dict[str, Optional[dict]]:
+        """Token data by lowercase address; tokens missing from the cache are fetched in batches."""
+        addresses = list(dict.fromkeys(address.lower() for address in addresses))
+        now = time.monotonic()
+        with self.lock:
+            cached = {address: self.cache[address][1] for address in addresses
+                      if address in self.cache and now - self.cache[address][0] < self.ttl}
+        for address in addresses:
+            metrics.cache('market_data', address in cached)
+
+        missing = [address for address in addresses if address not in cached]
+        for i in range(0, len(missing), self.BATCH_SIZE):
+            infos = self.fetch(missing[i:i + self.BATCH_SIZE])
+            with self.lock:
+                for address, info in infos.items():
+                    self.cache[address] = (now, info)
+            cached.update(infos)
+        return cached
+
+    def get(self, address: str) -> Optional[dict]:
+        return self.get_many([address])[address.lower()]
+
+
+_market_data: Dict[str, MarketData] = {}
+_market_data_lock = Lock()
+
+
+def get_market_data(base_url: str = DEXSCREENER_URL) -> MarketData:
+    """Process-wide market data layer for a Dexscreener URL, so that its cache is shared."""
+    with _market_data_lock:
+        if base_url not in _market_data:
+            _market_data[base_url] = MarketData(base_url)
+        return _market_data[base_url]
+
+
 @dataclass
 class CryptoInfo:
-    api_key: str
+    api_key: Union[str, List[str]]
+    etherscan_url: str = ETHERSCAN_URL
+    dexscreener_url: str = DEXSCREENER_URL
     exclude = ["github.com", "proofpatform.io", "zeppelin", "instagram.com", "dapp.tools", "solidity", "eips.ethereum",
                "eth.wiki", "nomic-labs-blog", "etherscan", "Etherscan", 'tokenmint.io', 'hardhat']
 
@@ -71,53 +217,68 @@ class CryptoInfo:
             s = s.replace("-https://", "https://", 1) # replace only the first occurrence
         return s
 
+    @staticmethod
+    def link_candidates(source: str):
+        """Whitespace-separated words of `source` containing a link keyword, found in one regex scan."""
+        end = 0
+        for match in LINK_KEYWORDS.finditer(source):
+            if match.start() < end:
+                continue  # another keyword of the same word
+            start = match.start()
+            while start > 0 and not source[start - 1].isspace():
+                start -= 1
+            end = NON_SPACE.match(source, match.start()).end()
+            yield source[start:end]
+
+    def extract_links(self, source: str) -> Dict[str, str]:
+        """Twitter, Telegram and website links of a contract source; the last one of each kind wins."""
+        links = {}
+        for word in self.link_candidates(source):
+            if word.startswith("-http"):
+                word = word[1:]  # remove leading '-'
+            if word.startswith("http"):
+                if "twitter.com" in word:
+                    links["twitter"] = word
+                elif "telegram.me" in word or "t.me" in word:
+                    links["telegram"] = word
+                else:
+                    if not any(substring in word for substring in self.exclude):
+                        links["website"] = word
+            else:
+                if "twitter.com" in word:
+                    links["twitter"] = "https://" + word
+                elif "telegram.me" in word or "t.me" in word:
+                    links["telegram"] = "https://" + word
+                else:
+                    if ".io" in word:
+                        if not any(substring in word for substring in self.exclude):
+                            links["website"] = "https://" + word
+        return links
+
     def scrap_contract_links(self, contract_address) -> Dict[str, str]:
+        """Links found in the verified source of a contract, which is only downloaded once."""
+        contract_address = contract_address.lower()
+        links = contract_links.get(contract_address)
+        metrics.cache('contract_links', links is not None)
+        if links is not None:
+            return links
         try:
-            url = f"https://api.etherscan.io/api?module=contract&action=getsourcecode&apikey={self.api_key}&address={contract_address.lower()}"
-            response = requests.get(url)
-            response.raise_for_status()
+            client = get_client(self.api_key, self.etherscan_url)
+            result = client.get_result(module='contract', action='getsourcecode', address=contract_address)
 
             links = {}
-            for info in response.json()["result"]:
-                for word in info['SourceCode'].split():
-                    if word.startswith("-http"):
-                        word = word[1:]  # remove leading '-'
-                    if word.startswith("http"):
-                        if "twitter.com" in word:
-                            links["twitter"] = word
-                        elif "telegram.me" in word or "t.me" in word:
-                            links["telegram"] = word
-                        else:
-                            if not any(substring in word for substring in self.exclude):
-                                links["website"] = word
-                    else:
-                        if "twitter.com" in word:
-                            links["twitter"] = "https://" + word
-                        elif "telegram.me" in word or "t.me" in word:
-                            links["telegram"] = "https://" + word
-                        else:
-                            if ".io" in word:
-                                if not any(substring in word for substring in self.exclude):
-                                    links["website"] = "https://" + word
+            for info in result:
+                links.update(self.extract_links(info['SourceCode']))
+            # Unverified contracts have no source yet, they are looked up again next time
+            if any(info['SourceCode'] for info in result):
+                contract_links.set(contract_address, links)
             return links
         except Exception as e:
             return None
 
     def scrap_dexscreener(self, contract_address) -> Dict[str, str]:
         try:
-            url = f"https://api.dexscreener.com/latest/dex/tokens/{contract_address.lower()}"
-            response = requests.get(url)
-            response.raise_for_status()
-
-            info = response.json()['pairs'][0]
-            infos = {"name": info['baseToken']['name'],
-                     "symbol": info['baseToken']['symbol'],
-                     "mc": self.format_number(info['fdv']),
-                     "usd_price": info['priceUsd'],
-                     "volume": self.format_number(info['volume']['h24']),
-                     "priceChange": info['priceChange']['h24'],
-                     "creation": info['pairCreatedAt']}
-            return infos
+            return get_market_data(self.dexscreener_url).get(contract_address)
         except Exception as e:
             return None
 
@@ -131,8 +292,11 @@ class CryptoInfo:
             return str(num)
 
     def create_and_print_message(self, contract_address):
-        links = self.scrap_contract_links(contract_address)
-        infos = self.scrap_dexscreener(contract_address)
+        # The contract links (usually cached) and the market data are fetched at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            links = executor.submit(metrics.propagate(self.scrap_contract_links), contract_address)
+            infos = executor.submit(metrics.propagate(self.scrap_dexscreener), contract_address)
+            links, infos = links.result(), infos.result()
 
         message = f"{infos['name']} - ${infos['symbol']} - {infos['mc']} MC\n" \
                   f"\n📩 {links.get('telegram', 'Not available')}\n" \
@@ -149,80 +313,121 @@ class CryptoInfo:
 
 @dataclass
 class EtherscanAPI:
-    api_key: str
+    api_key: Union[str, List[str]]
+    base_url: str = ETHERSCAN_URL
+    dexscreener_url: str = DEXSCREENER_URL
+    rpc_url: Optional[str] = None
     WEI_TO_ETHER = 10 ** 18
-
-    def get_transactions(self, address: str) -> List[dict]:
-        url = f"https://api.etherscan.io/api?module=account&action=txlist&address={address}&startblock=0&endblock=99999999&sort=desc&apikey={self.api_key}"
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('result', [])
-        response.raise_for_status()
-
-    def was_address_active_before(self, transactions: List[dict], timestamp: datetime, txhash: str) -> bool:
-        for tx in transactions:
-            if tx['hash'] == txhash:
-                continue
-            tx_time = datetime.utcfromtimestamp(int(tx['timeStamp']))
-            if tx_time < timestamp:
-                return True
-        return False
+    BALANCEMULTI_SIZE = 20
+    KNOWN_COINS = frozenset({'0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2'})  # WETH
+
+    @classmethod
+    def from_config(cls, config: Config) -> "EtherscanAPI":
+        return cls(config.get_value('Etherscan.API_KEY'), config.get_value('Etherscan.BASE_URL', ETHERSCAN_URL),
+                   config.get_value('Dexscreener.BASE_URL', DEXSCREENER_URL),
+                   config.get_value('Ethereum.RPC_URL', None))
+
+    @property
+    def client(self) -> EtherscanClient:
+        return get_client(self.api_key, self.base_url)
+
+    @property
+    def store(self) -> TransactionStore:
+        return get_store(self.client)
+
+    def get_transactions(self, address: str, start_block: Optional[int] = None, end_block: Optional[int] = None,
+                         start_time: Optional[int] = None, end_time: Optional[int] = None) -> List[dict]:
+        """Newest-first transactions of an address, served from the local store after an incremental sync."""
+        return self.store.get_transactions(address, sort='desc', start_block=start_block, end_block=end_block,
+                                           start_time=start_time, end_time=end_time)
+
+    def was_address_active_before(self, address: str, timestamp: int) -> bool:
+        """Whether the address had a transaction before `timestamp` (unix seconds), from the first-seen index."""
+        first_seen = self.store.first_seen(address)
+        return first_seen is not None and first_seen[1] < timestamp
 
     def did_address_create_contract(self, transactions: List[dict]) -> bool:
         return any(isinstance(tx, dict) and tx['to'] == '' for tx in transactions)
 
-    def did_address_swap(self, transactions: List[dict]) -> bool:
-        db_manager = DBManager(db_name='kendhalaltay', user='kendhalaltay')
-        processed_transactions = set(db_manager.get_all_transactions())  # Convert to set for quicker lookup
-
+    def find_new_swap(self, transactions: List[dict]) -> Optional[dict]:
+        """Return the first swap transaction that has not been alerted on yet, if any."""
         functions_to_check = ['swapExactETHForTokens', 'unoswap', 'execute', 'swap']
         uniswap_router_address = "0x3fC91A3afd70395Cd496C647d5a6CC9D4B2b7FAD".lower()
 
         for tx in transactions:
             if isinstance(tx, dict) and (('functionName' in tx and any(func in tx['functionName'] for func in functions_to_check)) or tx.get('to', '').lower() == uniswap_router_address):
                 if tx['hash'] not in processed_transactions:
-                    db_manager.insert_transaction(tx['hash'])
-                    db_manager.close_connection()
-                    telegram_alert = TelegramAlert()
-                    telegram_alert.send_telegram_message(
-                        f"A swap was performed, here's the link: https://etherscan.io/tx/{tx['hash']}")
-                    try:
-                        crypto_info = CryptoInfo(self.api_key)
-                        for token in self.get_token_address(tx['hash']):
-                            try:
-                                telegram_alert.send_telegram_message(f"{crypto_info.create_and_print_message(token)}")
-                            except TypeError as e:
-                                continue
-                    except IndexError as e:
-                        continue
-                    return True
-
-        db_manager.close_connection()  # Close the connection when done
-        return False
+                    return tx
+        return None
+
+    def swap_alert_messages(self, txhash: str, tokens: Optional[Set[str]] = None) -> List[str]:
+        """The alert of a swap: its link, then the details of every token it brought in.
+
+        The link is always part of the alert. A token whose details cannot be fetched is left out, and so are
+        all of them if the receipt of the swap cannot be read.
+        """
+        messages = [f"A swap was performed, here's the link: https://etherscan.io/tx/{txhash}"]
+        if tokens is None:
+            try:
+                tokens = self.get_token_address(txhash)
+            except Exception as e:
+                print("An error occurred while reading the tokens of a swap")
+                print(e)
+                return messages
+        crypto_info = CryptoInfo(self.api_key, self.base_url, self.dexscreener_url)
+        try:
+            get_market_data(self.dexscreener_url).get_many(list(tokens))  # one request for every token
+        except Exception as e:
+            pass
+        for token in tokens:
+            try:
+                messages.append(crypto_info.create_and_print_message(token))
+            except Exception as e:
+                continue  # no pair yet, or Dexscreener or Etherscan failed
+        return messages
+
+    def did_address_swap(self, transactions: List[dict]) -> bool:
+        swap = self.find_new_swap(transactions)
+        if swap is None:
+            return False
+        if processed_transactions.claim(swap['hash']):
+            alerts.enqueue(swap['hash'])
+        return True
 
     def get_balance(self, address: str) -> float:
-        url = f"https://api.etherscan.io/api?module=account&action=balance&address={address}&tag=latest&apikey={self.api_key}"
-        response = requests.get(url)
-        if response.status_code != 200:
-            response.raise_for_status()
-        data = response.json()
+        data = self.client.get(module='account', action='balance', address=address, tag='latest')
         return int(data.get('result', 0)) / self.WEI_TO_ETHER
 
-    def get_token_address(self, txhash: str):
-        known_coins = [
-            '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2',
-        ]
-        addresses = set()
-        url = f"https://api.etherscan.io/api?module=proxy&action=eth_getTransactionReceipt&txhash={txhash}&apikey={self.api_key}"
-        response = requests.get(url)
-        if response.status_code != 200:
-            response.raise_for_status()
-        data = response.json()
-        for i in data.get('result')['logs']:
-            if i.get('address').lower() not in [coin.lower() for coin in known_coins]:
-                addresses.add(i.get('address'))
-        return addresses
+    def get_balances(self, addresses: List[str]) -> Dict[str, float]:
+        """ETH balances of many addresses, fetched with one `balancemulti` call per 20 addresses.
+
+        Addresses missing from Etherscan's answer are left out, so that callers do not mistake them for empty.
+        """
+        balances = {}
+        for i in range(0, len(addresses), self.BALANCEMULTI_SIZE):
+            batch = addresses[i:i + self.BALANCEMULTI_SIZE]
+            data = self.client.get(module='account', action='balancemulti', address=','.join(batch), tag='latest')
+            result = data.get('result')
+            if not isinstance(result, list):
+                raise RuntimeError(f"Etherscan balancemulti failed: {data.get('message')} {result}")
+            results = {item['account'].lower(): int(item['balance']) for item in result}
+            for address in batch:
+                if address.lower() in results:
+                    balances[address] = results[address.lower()] / self.WEI_TO_ETHER
+        return balances
+
+    @property
+    def receipts(self):
+        return get_receipt_backend(self.client, self.rpc_url)
+
+    def get_token_addresses(self, txhashes: List[str]) -> Dict[str, Set[str]]:
+        """Tokens received by the sender of each transaction, decoded from receipts fetched in batches."""
+        receipts = self.receipts.get_receipts(txhashes)
+        return {txhash: received_tokens(receipt, receipt['from'], self.KNOWN_COINS)
+                for txhash, receipt in receipts.items() if receipt}
+
+    def get_token_address(self, txhash: str) -> Set[str]:
+        return self.get_token_addresses([txhash]).get(txhash, set())
 
 
 class FileManager:
@@ -232,20 +437,57 @@ class FileManager:
 
     @staticmethod
     def write_to_file(file_path: str, data: dict) -> None:
-        with open(file_path, 'w') as f:
+        """Write JSON to a temporary file that then replaces `file_path`, so a crash never leaves it half written."""
+        with open(file_path + '.tmp', 'w') as f:
             json.dump(data, f, indent=2)
+        os.replace(file_path + '.tmp', file_path)
 
 
 class DBManager:
+    """Database session borrowing a connection from a process-wide pool.
+
+    Used as a context manager, the connection goes back to the pool when the block exits, or is closed if the
+    block failed on a lost connection. Outside a `with` block, `close_connection` returns it.
+    """
+    _pools: Dict[tuple, ThreadedConnectionPool] = {}
+    _pools_lock = Lock()
+    MAX_CONNECTIONS = 8
+
     def __init__(self, db_name, user, password=None, host="localhost"):
-        self.conn = psycopg2.connect(dbname=db_name, user=user, password=password, host=host)
+        self.pool = self.get_pool(db_name, user, password, host)
+        self.conn = self.pool.getconn()
         self.c = self.conn.cursor()
-        self.c.execute('''CREATE TABLE IF NOT EXISTS addresses
-                     (address text PRIMARY KEY)''')
-        self.c.execute('''CREATE TABLE IF NOT EXISTS transactions
-                             (txhash text PRIMARY KEY)''')
-        self.conn.commit()
 
+    @classmethod
+    def get_pool(cls, db_name, user, password=None, host="localhost") -> ThreadedConnectionPool:
+        key = (db_name, user, password, host)
+        with cls._pools_lock:
+            if key not in cls._pools:
+                pool = ThreadedConnectionPool(1, cls.MAX_CONNECTIONS, dbname=db_name, user=user,
+                                              password=password, host=host)
+                conn = pool.getconn()
+                with conn.cursor() as c:
+                    c.execute('''CREATE TABLE IF NOT EXISTS addresses
+                                 (address text PRIMARY KEY)''')
+                    c.execute('''CREATE TABLE IF NOT EXISTS transactions
+                                 (txhash text PRIMARY KEY)''')
+                    c.execute('''CREATE TABLE IF NOT EXISTS checkpoints
+                                 (name text PRIMARY KEY, block bigint)''')
+                    c.execute('''CREATE TABLE IF NOT EXISTS address_meta
+                                 (address text PRIMARY KEY, funded_at bigint, last_activity bigint, last_block bigint,
+                                  check_interval double precision, next_check double precision)''')
+                    c.execute('''CREATE TABLE IF NOT EXISTS alert_outbox
+                                 (txhash text PRIMARY KEY, created_at timestamptz NOT NULL DEFAULT now())''')
+                    # Leases of the rows being worked on, see `MonitorWorker`
+                    for table in ('address_meta', 'alert_outbox'):
+                        c.execute(f'''ALTER TABLE {table} ADD COLUMN IF NOT EXISTS leased_by text,
+                                      ADD COLUMN IF NOT EXISTS lease_until double precision''')
+                conn.commit()
+                pool.putconn(conn)
+                cls._pools[key] = pool
+            return cls._pools[key]
+
+    @metrics.timed('db_write')
     def insert_address(self, address):
         try:
             self.c.execute(sql.SQL("INSERT INTO addresses (address) VALUES (%s)"), (address,))
@@ -254,6 +496,7 @@ class DBManager:
         else:
             self.conn.commit()
 
+    @metrics.timed('db_write')
     def insert_transaction(self, txhash):
         try:
             self.c.execute(sql.SQL("INSERT INTO transactions (txhash) VALUES (%s)"), (txhash,))
@@ -269,33 +512,456 @@ class DBManager:
         self.c.execute('SELECT txhash FROM transactions')
         return [record[0] for record in self.c.fetchall()]
 
+    def get_checkpoint(self, name: str) -> Optional[int]:
+        self.c.execute("SELECT block FROM checkpoints WHERE name=%s", (name,))
+        record = self.c.fetchone()
+        return record[0] if record else None
+
+    @metrics.timed('db_write')
+    def set_checkpoint(self, name: str, block: int):
+        self.c.execute("""INSERT INTO checkpoints (name, block) VALUES (%s, %s)
+                          ON CONFLICT (name) DO UPDATE SET block=GREATEST(checkpoints.block, EXCLUDED.block)""",
+                       (name, block))
+        self.conn.commit()
+
+    @metrics.timed('db_write')
     def remove_address(self, address: str):
         self.c.execute("DELETE FROM addresses WHERE address=%s", (address,))
+        self.c.execute("DELETE FROM address_meta WHERE address=%s", (address,))
+        self.conn.commit()
+
+    def get_address_meta(self) -> Dict[str, tuple]:
+        self.c.execute("""SELECT address, funded_at, last_activity, last_block, check_interval, next_check
+                          FROM address_meta""")
+        return {record[0]: record for record in self.c.fetchall()}
+
+    @metrics.timed('db_write')
+    def save_address_meta(self, rows: List[tuple]):
+        """Insert or update (address, funded_at, last_activity, last_block, check_interval, next_check) rows."""
+        execute_values(self.c, """INSERT INTO address_meta
+                                  (address, funded_at, last_activity, last_block, check_interval, next_check)
+                                  VALUES %s ON CONFLICT (address) DO UPDATE SET
+                                  funded_at=EXCLUDED.funded_at, last_activity=EXCLUDED.last_activity,
+                                  last_block=EXCLUDED.last_block, check_interval=EXCLUDED.check_interval,
+                                  next_check=EXCLUDED.next_check, leased_by=NULL, lease_until=NULL""", rows)
         self.conn.commit()
 
+    @metrics.timed('db_write')
+    def add_missing_address_meta(self):
+        """Give the watched addresses without metadata a row that is due right away, funding time unknown."""
+        self.c.execute("""INSERT INTO address_meta (address, next_check) SELECT address, 0 FROM addresses
+                          ON CONFLICT DO NOTHING""")
+        self.conn.commit()
+
+    @metrics.timed('db_write')
+    def claim_addresses(self, worker: str, lease: float, limit: int) -> List[tuple]:
+        """Lease up to `limit` due addresses that no other worker holds, most overdue first."""
+        now = time.time()
+        self.c.execute("""UPDATE address_meta SET leased_by=%s, lease_until=%s
+                          WHERE address IN (SELECT address FROM address_meta
+                                            WHERE next_check <= %s AND (lease_until IS NULL OR lease_until < %s)
+                                            ORDER BY next_check LIMIT %s FOR UPDATE SKIP LOCKED)
+                          RETURNING address, funded_at, last_activity, last_block, check_interval, next_check""",
+                       (worker, now + lease, now, now, limit))
+        rows = self.c.fetchall()
+        self.conn.commit()
+        return rows
+
+    def try_advisory_lock(self, key: int) -> bool:
+        """Take a session-level advisory lock, held until this connection closes."""
+        self.c.execute("SELECT pg_try_advisory_lock(%s)", (key,))
+        locked = self.c.fetchone()[0]
+        self.conn.commit()
+        return locked
+
+    def holds_advisory_lock(self, key: int) -> bool:
+        """Whether this connection still holds an advisory lock taken with `try_advisory_lock`."""
+        self.c.execute('''SELECT EXISTS (SELECT 1 FROM pg_locks
+                                          WHERE locktype = 'advisory' AND granted AND pid = pg_backend_pid()
+                                          AND ((classid::bigint << 32) | objid::bigint) = %s AND objsubid = 1)''',
+                       (key,))
+        held = self.c.fetchone()[0]
+        self.conn.commit()
+        return held
+
+    def get_pending_alerts(self) -> List[str]:
+        """Alerts still to send, except those another worker is sending."""
+        self.c.execute("""SELECT txhash FROM alert_outbox WHERE lease_until IS NULL OR lease_until < %s
+                          ORDER BY created_at""", (time.time(),))
+        return [record[0] for record in self.c.fetchall()]
+
+    @metrics.timed('db_write')
+    def claim_swap(self, txhash: str) -> bool:
+        """Record a swap and add its alert to the outbox atomically; False if it was already recorded."""
+        self.c.execute("""WITH claimed AS (INSERT INTO transactions (txhash) VALUES (%s)
+                                           ON CONFLICT DO NOTHING RETURNING txhash)
+                          INSERT INTO alert_outbox (txhash) SELECT txhash FROM claimed
+                          ON CONFLICT DO NOTHING RETURNING txhash""", (txhash,))
+        claimed = self.c.fetchone() is not None
+        self.conn.commit()
+        return claimed
+
+    @metrics.timed('db_write')
+    def claim_alert(self, txhash: str, worker: str, lease: float) -> bool:
+        """Lease an outbox row for `lease` seconds; False if it is gone or leased by another worker."""
+        now = time.time()
+        self.c.execute("""UPDATE alert_outbox SET leased_by=%s, lease_until=%s
+                          WHERE txhash=%s AND (lease_until IS NULL OR lease_until < %s OR leased_by=%s)
+                          RETURNING txhash""", (worker, now + lease, txhash, now, worker))
+        claimed = self.c.fetchone() is not None
+        self.conn.commit()
+        return claimed
+
+    @metrics.timed('db_write')
+    def release_alert(self, txhash: str):
+        self.c.execute("UPDATE alert_outbox SET leased_by=NULL, lease_until=NULL WHERE txhash=%s", (txhash,))
+        self.conn.commit()
+
+    @metrics.timed('db_write')
+    def remove_alert(self, txhash: str):
+        self.c.execute("DELETE FROM alert_outbox WHERE txhash=%s", (txhash,))
+        self.conn.commit()
+
+    def __enter__(self) -> "DBManager":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if isinstance(exc, (psycopg2.OperationalError, psycopg2.InterfaceError)) or self.conn.closed:
+            self.discard_connection()
+        else:
+            self.close_connection()  # the pool rolls back an unfinished transaction
+
     def close_connection(self):
-        self.conn.close()
+        self.c.close()
+        self.pool.putconn(self.conn)
+
+    def discard_connection(self):
+        """Close a broken connection instead of returning it to the pool."""
+        self.pool.putconn(self.conn, close=True)
+
+
+class ProcessedTransactions:
+    """In-memory index of the swap hashes already alerted on, backed by the `transactions` table.
+
+    The table is read once. `claim` records a new swap and adds its alert to the outbox in a single
+    statement, so that when several workers see the same swap only one of them reports it.
+    """
+
+    def __init__(self, db_name, user):
+        self.db_name = db_name
+        self.user = user
+        self.hashes = None
+        self.lock = Lock()
+
+    def _load(self):
+        with DBManager(db_name=self.db_name, user=self.user) as db:
+            self.hashes = set(db.get_all_transactions())
+
+    def __contains__(self, txhash: str) -> bool:
+        with self.lock:
+            if self.hashes is None:
+                self._load()
+            return txhash in self.hashes
+
+    def claim(self, txhash: str) -> bool:
+        """Record a new swap before it is alerted on; True only for the caller that recorded it.
+
+        The hash is written to the database first and only then to the in-memory index, so that a crash or a
+        failed write can neither lose the alert nor send it without a record of it.
+        """
+        with self.lock:
+            if self.hashes is None:
+                self._load()
+            if txhash in self.hashes:
+                return False
+        with DBManager(db_name=self.db_name, user=self.user) as db:
+            claimed = db.claim_swap(txhash)
+        with self.lock:
+            self.hashes.add(txhash)
+        return claimed
+
+
+processed_transactions = ProcessedTransactions(db_name='kendhalaltay', user='kendhalaltay')
+
+
+class AlertQueue:
+    """Swap alerts delivered by a background thread, so that detection never waits on Telegram.
+
+    A swap is first written to the `alert_outbox` table, so alerts still queued at a restart are sent by the
+    next run. The sender looks up the tokens of the swap, merges its messages into as few Telegram messages as
+    possible and sends them within the per-chat rate limit; a delivered swap leaves the outbox. An alert is
+    leased while it is being sent, so that workers sharing the outbox do not send it twice, and the outbox is
+    read again every minute to pick up the alerts of a worker that stopped. An alert that could not be sent
+    stays in the outbox and is retried after a delay that doubles with every failure, up to `MAX_RETRY_DELAY`.
+    """
+    MAX_SIZE = 1000
+    BATCH_SIZE = 20
+    RETRY_DELAY = 5
+    MAX_RETRY_DELAY = 900
+    MAX_RETRIES = 3
+    MAX_MESSAGE_LENGTH = 4096
+    LEASE = 300
+    RELOAD_INTERVAL = 60
+
+    def __init__(self, db_name, user, max_size=MAX_SIZE):
+        self.db_name = db_name
+        self.user = user
+        self.queue = Queue(max_size)
+        self.queued = set()
+        self.failures = Counter()
+        self.next_attempt: Dict[str, float] = {}
+        self.overflowed = False
+        self.started = False
+        self.lock = Lock()
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def start(self, config: Optional[Config] = None):
+        """Start the sender thread and queue the alerts left in the outbox by a previous run."""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        config = config or Config("credentials.yml")
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.telegram = TelegramAlert(config, session)
+        self.etherscan = EtherscanAPI.from_config(config)
+        self.rate = float(config.get_value('Telegram.MESSAGES_PER_SECOND', 1))
+        self.reload()
+        Thread(target=self.run, daemon=True).start()
+
+    def enqueue(self, txhash: str):
+        """Queue the alert of a swap already in the outbox."""
+        self.start()
+        self._enqueue(txhash)
+
+    def _enqueue(self, txhash: str):
+        with self.lock:
+            if txhash in self.queued:
+                return
+            try:
+                self.queue.put_nowait(txhash)
+            except Full:
+                # Left in the outbox, it is queued again once the sender has caught up
+                self.overflowed = True
+                metrics.inc('alert_queue_overflows_total')
+                return
+            self.queued.add(txhash)
+
+    def reload(self):
+        with DBManager(db_name=self.db_name, user=self.user) as db:
+            pending = db.get_pending_alerts()
+        now = time.monotonic()
+        with self.lock:
+            self.overflowed = False
+            # Alerts another worker delivered are forgotten
+            for txhash in set(self.next_attempt) - set(pending):
+                del self.next_attempt[txhash], self.failures[txhash]
+            pending = [txhash for txhash in pending if self.next_attempt.get(txhash, now) <= now]
+        for txhash in pending:
+            self._enqueue(txhash)
+
+    def reload_wait(self) -> float:
+        """Seconds until the outbox must be read again: when the next retry is due, at most `RELOAD_INTERVAL`."""
+        with self.lock:
+            next_attempt = min(self.next_attempt.values(), default=float('inf'))
+        return min(max(next_attempt - time.monotonic(), 0), self.RELOAD_INTERVAL)
+
+    def join(self):
+        """Wait until every queued alert has been handled."""
+        self.queue.join()
+
+    def run(self):
+        while True:
+            try:
+                # At least a second apart, should the outbox be unreadable
+                batch = [self.queue.get(timeout=max(self.reload_wait(), 1))]
+            except Empty:
+                try:
+                    self.reload()
+                except Exception as e:
+                    print("An error occurred while reading the alert outbox")
+                    print(e)
+                continue
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                # The receipts of a burst of swaps are fetched together
+                tokens = self.etherscan.get_token_addresses(batch)
+            except Exception as e:
+                tokens = {}
+            for txhash in batch:
+                try:
+                    delivered = self.deliver(txhash, tokens.get(txhash))
+                except Exception as e:
+                    print("An error occurred while sending a swap alert")
+                    print(e)
+                    delivered = False
+                with self.lock:
+                    self.queued.discard(txhash)
+                    if delivered:
+                        self.failures.pop(txhash, None)
+                        self.next_attempt.pop(txhash, None)
+                    else:
+                        self.failures[txhash] += 1
+                        delay = min(self.RETRY_DELAY * 2 ** (self.failures[txhash] - 1), self.MAX_RETRY_DELAY)
+                        self.next_attempt[txhash] = time.monotonic() + delay
+            try:
+                if self.queue.empty() and (self.overflowed or self.reload_wait() == 0):
+                    self.reload()
+            except Exception as e:
+                print("An error occurred while reading the alert outbox")
+                print(e)
+            for _ in batch:
+                self.queue.task_done()
+
+    @metrics.timed('alerting')
+    def deliver(self, txhash: str, tokens: Optional[Set[str]] = None) -> bool:
+        with DBManager(db_name=self.db_name, user=self.user) as db:
+            if not db.claim_alert(txhash, WORKER_ID, self.LEASE):
+                return True  # already sent, or being sent by another worker
+            messages = self.etherscan.swap_alert_messages(txhash, tokens)
+            for message in self.coalesce(messages, self.MAX_MESSAGE_LENGTH):
+                if not self.send(message):
+                    db.release_alert(txhash)
+                    return False
+            db.remove_alert(txhash)
+            return True
+
+    def send(self, message: str) -> bool:
+        """Send one message, retrying after rate limits and server errors."""
+        bucket = self.buckets.setdefault(self.telegram.chat_id, TokenBucket(self.rate))
+        for attempt in range(self.MAX_RETRIES + 1):
+            with metrics.timer('rate_limit_wait_seconds', service='telegram'):
+                bucket.acquire()
+            try:
+                data = self.telegram.post_message(message)
+            except Exception as e:
+                data = {}
+            if data.get('ok'):
+                return True
+            if data.get('error_code', 500) < 500 and data.get('error_code') != 429:
+                print(f"Telegram refused the alert message: {data.get('description')}")
+                return False
+            time.sleep(data.get('parameters', {}).get('retry_after', 2 ** attempt))
+        return False
+
+    @staticmethod
+    def coalesce(parts: List[str], limit: int) -> List[str]:
+        """Join message parts into as few messages of at most `limit` characters as possible."""
+        messages = []
+        for part in parts:
+            part = part[:limit]
+            if messages and len(messages[-1]) + 2 + len(part) <= limit:
+                messages[-1] += "\n\n" + part
+            else:
+                messages.append(part)
+        return messages
+
+
+alerts = AlertQueue(db_name='kendhalaltay', user='kendhalaltay')
+
+
+def fetch_histories(etherscan: EtherscanAPI, addresses: List[str], desc: str,
+                    max_workers: int = DEFAULT_CONCURRENCY) -> Dict[str, List[dict]]:
+    """Fetch the transactions of many addresses concurrently, keyed by address in input order.
+
+    The shared Etherscan client rate-limits the workers, so `max_workers` only bounds how many
+    requests are in flight at once.
+    """
+    addresses = list(dict.fromkeys(addresses))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        histories = tqdm(executor.map(metrics.propagate(etherscan.get_transactions), addresses),
+                         total=len(addresses), desc=desc)
+        return dict(zip(addresses, histories))
 
 
 def check_swaps():
-    db = DBManager(db_name='kendhalaltay', user='kendhalaltay')
-    addresses = db.get_all_addresses()
+    config = Config("credentials.yml")
+    with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+        addresses = db.get_all_addresses()
 
-    etherscan = EtherscanAPI(Config("credentials.yml").get_value('Etherscan.API_KEY'))
+    etherscan = EtherscanAPI.from_config(config)
+
+    # Fetch concurrently, then classify each address in table order
+    with metrics.stage('fetch'):
+        histories = fetch_histories(etherscan, addresses, "Checking swaps",
+                                    config.get_value('Monitor.CONCURRENCY', DEFAULT_CONCURRENCY))
 
     addresses_with_swap = []
-    for address in tqdm(addresses, desc="Checking swaps"):
-        transactions = etherscan.get_transactions(address)
-        if etherscan.did_address_swap(transactions):
-            addresses_with_swap.append(address)
-        elif etherscan.did_address_create_contract(transactions):
-            db.remove_address(address)
-        elif etherscan.get_balance(address) < 0.1:
+    addresses_to_check_balance = []
+    addresses_to_remove = []
+    with metrics.stage('classify'):
+        for address in addresses:
+            transactions = histories[address]
+            if etherscan.did_address_swap(transactions):
+                addresses_with_swap.append(address)
+            elif etherscan.did_address_create_contract(transactions):
+                addresses_to_remove.append(address)
+            else:
+                addresses_to_check_balance.append(address)
+
+    # Drop addresses holding less than 0.1 ETH, 20 balances per request; those without an answer are kept
+    with metrics.stage('balances'):
+        balances = etherscan.get_balances(addresses_to_check_balance)
+    addresses_to_remove += [address for address in addresses_to_check_balance
+                            if address in balances and balances[address] < 0.1]
+
+    with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+        for address in addresses_to_remove:
             db.remove_address(address)
 
     print(f"\nAddresses that performed a swap: {addresses_with_swap}")
 
-    db.close_connection()
+
+def is_qualifying_transfer(tx: dict, address: str, since: Optional[datetime] = None) -> bool:
+    """Outbound transfer of 0.5 to 10 ETH from `address`, optionally no older than `since` (local time)."""
+    if tx['from'].lower() != address.lower():
+        return False
+    if since is not None and datetime.fromtimestamp(int(tx['timeStamp'])) < since:
+        return False
+    value_ether = int(tx['value']) / EtherscanAPI.WEI_TO_ETHER
+    return 0.5 <= value_ether <= 10
+
+
+def screen_recipients(etherscan: EtherscanAPI, transfers: List[dict],
+                      max_workers: int = DEFAULT_CONCURRENCY) -> Tuple[List[str], List[str]]:
+    """Return the recipients with no prior activity, and those of them that never created a contract."""
+    # Filter addresses with no activity before the transaction from the target wallet: the first-seen index
+    # needs one tiny request per address it does not know yet, made concurrently
+    addresses_with_no_prior_activity = []
+    with metrics.stage('prior_activity'):
+        recipients = list(dict.fromkeys(tx['to'] for tx in transfers))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(metrics.propagate(etherscan.store.first_seen), recipients))
+        for tx in transfers:
+            if not etherscan.was_address_active_before(tx['to'], int(tx['timeStamp'])):
+                addresses_with_no_prior_activity.append(tx['to'])
+
+    # Only the fresh addresses' histories are needed, for the contract filter
+    with metrics.stage('fetch'):
+        histories = fetch_histories(etherscan, addresses_with_no_prior_activity, "Checking contract creations",
+                                    max_workers)
+
+    # Filter addresses that created contracts
+    addresses_without_contracts = []
+    with metrics.stage('contract_filter'):
+        for address in addresses_with_no_prior_activity:
+            if not etherscan.did_address_create_contract(histories[address]):
+                addresses_without_contracts.append(address)
+
+    return addresses_with_no_prior_activity, addresses_without_contracts
+
+
+def save_addresses(addresses: List[str]):
+    with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+        for address in addresses:
+            db.insert_address(address)
 
 
 def main():
@@ -303,64 +969,429 @@ def main():
     config = Config("credentials.yml")
 
     # Get credentials
-    ETHERSCAN_API_KEY = config.get_value('Etherscan.API_KEY')
     ADDRESS = config.get_value('FixedFloat.ADDRESS')
 
     # Instantiate the EtherscanAPI
-    etherscan = EtherscanAPI(ETHERSCAN_API_KEY)
+    etherscan = EtherscanAPI.from_config(config)
 
-    # Fetch transactions
-    transactions = etherscan.get_transactions(ADDRESS)
+    # Fetch the transactions of the recency window
+    time_threshold = datetime.now() - RECENT_TRANSFER_WINDOW
+    with metrics.stage('fetch'):
+        transactions = etherscan.get_transactions(ADDRESS, start_time=int(time_threshold.timestamp()))
 
-    filtered_transactions = []
     print('------------------------------------------------------------------')
     print('\nTIME:', datetime.now(), '\n')
-    time_threshold = datetime.now() - timedelta(minutes=30)
 
     # Filter transactions
-    for tx in transactions:
-        tx_time = datetime.utcfromtimestamp(int(tx['timeStamp']))
-        if tx['from'].lower() == ADDRESS.lower() and tx_time >= (time_threshold - timedelta(hours=2)):
-            value_ether = int(tx['value']) / EtherscanAPI.WEI_TO_ETHER
-            if 0.5 <= value_ether <= 10:
-                filtered_transactions.append(tx)
-
-    # Filter addresses with no activity before the transaction from the target wallet
-    addresses_with_no_prior_activity = []
-    for tx in tqdm(filtered_transactions, desc="Checking prior activity"):
-        address = tx['to']
-        tx_time = datetime.utcfromtimestamp(int(tx['timeStamp']))
-        tx_hash = tx['hash']
-        transactions = etherscan.get_transactions(address)
-        if not etherscan.was_address_active_before(transactions, tx_time, tx_hash):
-            addresses_with_no_prior_activity.append(address)
+    with metrics.stage('transfer_filter'):
+        filtered_transactions = [tx for tx in transactions if is_qualifying_transfer(tx, ADDRESS, time_threshold)]
 
-    # Filter addresses that created contracts
-    addresses_without_contracts = []
-    for address in tqdm(addresses_with_no_prior_activity, desc="Checking contract creation"):
-        transactions = etherscan.get_transactions(address)
-        if not etherscan.did_address_create_contract(transactions):
-            addresses_without_contracts.append(address)
+    addresses_with_no_prior_activity, addresses_without_contracts = screen_recipients(
+        etherscan, filtered_transactions, config.get_value('Monitor.CONCURRENCY', DEFAULT_CONCURRENCY))
 
     print('\nNo Prior Activity:\n', addresses_with_no_prior_activity, '\n')
     print('\nAddresses without contract creation:\n', addresses_without_contracts, '\n')
 
-    # Write the filtered addresses to a SQLite database
-    db = DBManager(db_name='kendhalaltay', user='kendhalaltay')
-    for address in addresses_without_contracts:
-        db.insert_address(address)
-    db.close_connection()
+    # Write the filtered addresses to the database
+    save_addresses(addresses_without_contracts)
 
     print("Addresses written to database\n")
 
 
+class HotWalletTailer:
+    """Follows the hot wallet from a block checkpoint stored in Postgres.
+
+    Each poll requests only the transactions above the checkpoint and screens the qualifying
+    transfers right away, so the cost of a poll does not depend on the length of the wallet's history.
+    Like `main`, only transfers from the last `RECENT_TRANSFER_WINDOW` are screened: after a downtime the
+    tailer catches up on that window, not on everything since the checkpoint.
+    """
+    CHECKPOINT = 'fixedfloat_tailer'
+    PAGE_SIZE = 1000
+    MAX_RESULTS = 10000  # Etherscan returns no rows past page * offset = 10,000
+
+    def __init__(self, etherscan: EtherscanAPI, address: str, poll_interval: float = 15,
+                 max_workers: int = DEFAULT_CONCURRENCY):
+        self.etherscan = etherscan
+        self.address = address
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+
+    @classmethod
+    def from_config(cls, config: Config) -> "HotWalletTailer":
+        return cls(EtherscanAPI.from_config(config),
+                   config.get_value('FixedFloat.ADDRESS'),
+                   config.get_value('FixedFloat.POLL_INTERVAL', 15),
+                   config.get_value('Monitor.CONCURRENCY', DEFAULT_CONCURRENCY))
+
+    def fetch_new_transactions(self, checkpoint: Optional[int], since: datetime) -> List[dict]:
+        """Transactions above the checkpoint, oldest first, going back no further than the page reaching `since`.
+
+        Pages are read newest first: a regular poll needs a single short page, and the first run or a restart
+        after a long downtime stops reading once it is past the recency window.
+        """
+        transactions = []
+        page = 1
+        while page * self.PAGE_SIZE <= self.MAX_RESULTS:
+            batch = self.etherscan.client.get_result(module='account', action='txlist', address=self.address,
+                                                     startblock=0 if checkpoint is None else checkpoint + 1,
+                                                     endblock=99999999, page=page, offset=self.PAGE_SIZE, sort='desc')
+            if not isinstance(batch, list) or not batch:
+                break
+            transactions.extend(batch)
+            if len(batch) < self.PAGE_SIZE or datetime.fromtimestamp(int(batch[-1]['timeStamp'])) < since:
+                break
+            page += 1
+        return list(reversed(transactions))
+
+    def poll(self) -> List[str]:
+        """Process the transactions above the checkpoint and return the addresses added to the watchlist."""
+        with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+            checkpoint = db.get_checkpoint(self.CHECKPOINT)
+
+        since = datetime.now() - RECENT_TRANSFER_WINDOW
+        with metrics.stage('fetch'):
+            transactions = self.fetch_new_transactions(checkpoint, since)
+        if not transactions:
+            return []
+
+        transfers = [tx for tx in transactions if is_qualifying_transfer(tx, self.address, since)]
+        addresses_without_contracts = []
+        if transfers:
+            _, addresses_without_contracts = screen_recipients(self.etherscan, transfers, self.max_workers)
+            save_addresses(addresses_without_contracts)
+            print(f"\n{datetime.now()} - new addresses: {addresses_without_contracts}")
+
+        with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+            db.set_checkpoint(self.CHECKPOINT, max(int(tx['blockNumber']) for tx in transactions))
+        return addresses_without_contracts
+
+    def run(self):
+        slot = time.monotonic()
+        while True:
+            started = time.monotonic()
+            try:
+                with metrics.cycle('tailer', lag=started - slot):
+                    self.poll()
+            except Exception as e:
+                print("An error occurred while tailing the hot wallet")
+                print(e)
+            slot = started + self.poll_interval
+            time.sleep(max(0.0, slot - time.monotonic()))
+
+
+@dataclass
+class AddressMeta:
+    address: str
+    funded_at: int
+    last_activity: Optional[int] = None
+    last_block: Optional[int] = None
+    interval: float = 0
+    next_check: float = 0
+
+    @property
+    def last_seen(self) -> int:
+        return max(self.funded_at, self.last_activity or 0)
+
+
+class AdaptiveScheduler:
+    """Checks the watched addresses for swaps from a priority queue ordered by their next check time.
+
+    An address funded or active within the last `hot_window` seconds is checked every `hot_interval` seconds;
+    after that its interval doubles with every check, up to `max_interval`. Addresses idle for `idle_ttl`
+    seconds leave the watchlist. A check only requests the blocks above the last transaction seen, so the
+    cost of a pass depends on how many addresses are due rather than on the size of the watchlist.
+    """
+    MAX_BATCH = 1000
+
+    def __init__(self, etherscan: EtherscanAPI, hot_interval: float = 5, hot_window: float = 3600,
+                 max_interval: float = 3600, idle_ttl: float = 7 * 86400, max_workers: int = DEFAULT_CONCURRENCY,
+                 refresh_interval: float = 15):
+        self.etherscan = etherscan
+        self.hot_interval = hot_interval
+        self.hot_window = hot_window
+        self.max_interval = max_interval
+        self.idle_ttl = idle_ttl
+        self.max_workers = max_workers
+        self.refresh_interval = refresh_interval
+        self.meta: Dict[str, AddressMeta] = {}
+        self.heap: List[Tuple[float, str]] = []
+        self.refreshed = None
+
+    @classmethod
+    def from_config(cls, config: Config) -> "AdaptiveScheduler":
+        return cls(EtherscanAPI.from_config(config),
+                   float(config.get_value('Monitor.HOT_INTERVAL', 5)),
+                   float(config.get_value('Monitor.HOT_WINDOW', 3600)),
+                   float(config.get_value('Monitor.MAX_INTERVAL', 3600)),
+                   float(config.get_value('Monitor.IDLE_TTL', 7 * 86400)),
+                   config.get_value('Monitor.CONCURRENCY', DEFAULT_CONCURRENCY))
+
+    def schedule(self, meta: AddressMeta):
+        # Entries of removed or rescheduled addresses stay in the heap and are skipped when popped
+        self.meta[meta.address] = meta
+        heapq.heappush(self.heap, (meta.next_check, meta.address))
+
+    def refresh(self):
+        """Follow the `addresses` table: new addresses are due right away, removed ones are forgotten."""
+        with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+            addresses = db.get_all_addresses()
+            stored = db.get_address_meta()
+
+        watched = set(addresses)
+        for address in [address for address in self.meta if address not in watched]:
+            del self.meta[address]
+        now = time.time()
+        for address in addresses:
+            if address not in self.meta:
+                self.schedule(self.load_meta(stored.get(address, (address, None)), now))
+        self.refreshed = time.monotonic()
+
+    def load_meta(self, row: tuple, now: float) -> AddressMeta:
+        """Metadata of an `address_meta` row, due right away and funded when first seen if the row has no values.
+
+        Rows of addresses new to the table, or added by `MonitorWorker.refresh`, hold nothing but the address.
+        """
+        meta = AddressMeta(*row)
+        if meta.funded_at is None:
+            # Watched addresses are fresh, so they were first seen when funded
+            first_seen = self.etherscan.store.first_seen(meta.address)
+            meta.funded_at = first_seen[1] if first_seen else int(now)
+        meta.interval = meta.interval or 0
+        meta.next_check = meta.next_check or now
+        return meta
+
+    def due(self, now: float) -> List[AddressMeta]:
+        due = []
+        while self.heap and self.heap[0][0] <= now and len(due) < self.MAX_BATCH:
+            next_check, address = heapq.heappop(self.heap)
+            meta = self.meta.get(address)
+            if meta is not None and meta.next_check == next_check:
+                due.append(meta)
+        return due
+
+    def fetch(self, meta: AddressMeta) -> List[dict]:
+        start_block = None if meta.last_block is None else meta.last_block + 1
+        return self.etherscan.get_transactions(meta.address, start_block=start_block)
+
+    def reschedule(self, meta: AddressMeta, now: float) -> AddressMeta:
+        if now - meta.last_seen < self.hot_window:
+            meta.interval = self.hot_interval
+        else:
+            meta.interval = min(max(meta.interval, self.hot_interval) * 2, self.max_interval)
+        meta.next_check = now + meta.interval
+        self.schedule(meta)
+        return meta
+
+    def check(self, due: List[AddressMeta]):
+        """Check the due addresses like `check_swaps` does, then reschedule them or drop them."""
+        with metrics.stage('fetch'):
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                histories = list(executor.map(metrics.propagate(self.fetch), due))
+
+        now = time.time()
+        removed = set()
+        to_check_balance = []
+        # The new transactions only count as seen once the whole check went through: should a swap claim or a
+        # later step fail, the same blocks are fetched again on the retry
+        seen: Dict[str, Tuple[int, int]] = {}  # address -> (last activity, last block)
+        with metrics.stage('classify'):
+            for meta, transactions in zip(due, histories):
+                if transactions:
+                    seen[meta.address] = (
+                        max([meta.last_activity or 0] + [int(tx['timeStamp']) for tx in transactions]),
+                        max([meta.last_block or 0] + [int(tx['blockNumber']) for tx in transactions]))
+                if self.etherscan.did_address_swap(transactions):
+                    continue
+                last_seen = max(meta.last_seen, seen.get(meta.address, (0, 0))[0])
+                if self.etherscan.did_address_create_contract(transactions) or now - last_seen > self.idle_ttl:
+                    removed.add(meta.address)
+                else:
+                    to_check_balance.append(meta.address)
+
+        # Drop addresses holding less than 0.1 ETH, 20 balances per request; those without an answer are kept
+        with metrics.stage('balances'):
+            balances = self.etherscan.get_balances(to_check_balance)
+        removed.update(address for address in to_check_balance
+                       if address in balances and balances[address] < 0.1)
+
+        with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+            for address in removed:
+                db.remove_address(address)
+                del self.meta[address]
+            for meta in due:
+                if meta.address in seen:
+                    meta.last_activity, meta.last_block = seen[meta.address]
+            rescheduled = [self.reschedule(meta, now) for meta in due if meta.address not in removed]
+            if rescheduled:
+                db.save_address_meta([astuple(meta) for meta in rescheduled])
+
+    def run_pending(self) -> int:
+        """Check the addresses that are due and return how many were checked."""
+        if self.refreshed is None or time.monotonic() - self.refreshed >= self.refresh_interval:
+            self.refresh()
+        now = time.time()
+        due = self.due(now)
+        if not due:
+            return 0
+        try:
+            with metrics.cycle('adaptive', lag=now - min(meta.next_check for meta in due)):
+                self.check(due)
+        except Exception:
+            for meta in due:
+                if meta.address in self.meta:
+                    meta.next_check = now + self.hot_interval
+                    self.schedule(meta)
+            raise
+        return len(due)
+
+    def next_wait(self) -> float:
+        wait = self.heap[0][0] - time.time() if self.heap else self.refresh_interval
+        return min(max(wait, 0.5), self.refresh_interval)
+
+    def run(self):
+        while True:
+            try:
+                self.run_pending()
+            except Exception as e:
+                print("An error occurred while checking the watched addresses")
+                print(e)
+            time.sleep(self.next_wait())
+
+
+class MonitorWorker(AdaptiveScheduler):
+    """One of several processes, possibly on different hosts, sharing the watchlist through Postgres.
+
+    Instead of a local priority queue, each pass leases a batch of due addresses with `FOR UPDATE SKIP
+    LOCKED`, so workers never check the same address at once and the addresses of a crashed worker are
+    picked up again once its lease expires. Checked addresses are saved with their next check time and
+    released. Swaps are claimed in the `transactions` table, so each one is reported by a single worker.
+    Discovery runs on the worker holding a Postgres advisory lock.
+    """
+    DISCOVERY_LOCK = 7_420_317_110  # any key shared by the workers
+
+    def __init__(self, etherscan: EtherscanAPI, worker_id: str = WORKER_ID, lease: float = 120,
+                 batch_size: int = 100, **kwargs):
+        super().__init__(etherscan, **kwargs)
+        self.worker_id = worker_id
+        self.lease = lease
+        self.batch_size = batch_size
+        self.leader_db = None
+        self.leader = False
+        self.claimed = 0
+
+    @classmethod
+    def from_config(cls, config: Config) -> "MonitorWorker":
+        scheduler = AdaptiveScheduler.from_config(config)
+        return cls(scheduler.etherscan, lease=float(config.get_value('Monitor.LEASE', 120)),
+                   batch_size=int(config.get_value('Monitor.BATCH_SIZE', 100)),
+                   hot_interval=scheduler.hot_interval, hot_window=scheduler.hot_window,
+                   max_interval=scheduler.max_interval, idle_ttl=scheduler.idle_ttl,
+                   max_workers=scheduler.max_workers)
+
+    def schedule(self, meta: AddressMeta):
+        self.meta[meta.address] = meta  # the address_meta table is the queue
+
+    def refresh(self):
+        with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+            db.add_missing_address_meta()
+        self.refreshed = time.monotonic()
+
+    def due(self, now: float) -> List[AddressMeta]:
+        with DBManager(db_name='kendhalaltay', user='kendhalaltay') as db:
+            rows = db.claim_addresses(self.worker_id, self.lease, self.batch_size)
+
+        self.meta = {}
+        for row in rows:
+            meta = self.load_meta(row, now)
+            self.meta[meta.address] = meta
+        self.claimed = len(rows)
+        return list(self.meta.values())
+
+    def next_wait(self) -> float:
+        # A full batch means more addresses are probably due
+        return 0 if self.claimed >= self.batch_size else 1
+
+    def is_leader(self) -> bool:
+        """Whether this worker runs discovery, taking the lock when no other worker holds it.
+
+        A leader checks on every call that its connection still holds the lock: if the connection dropped,
+        Postgres released the lock and another worker may hold it by now.
+        """
+        try:
+            if self.leader_db is None:
+                self.leader_db = DBManager(db_name='kendhalaltay', user='kendhalaltay')
+            if self.leader and not self.leader_db.holds_advisory_lock(self.DISCOVERY_LOCK):
+                print("Lost the discovery lock")
+                self.leader = False
+            if not self.leader:
+                self.leader = self.leader_db.try_advisory_lock(self.DISCOVERY_LOCK)
+        except psycopg2.Error as e:
+            # The lock went with the connection, another worker can take over
+            print("Lost the discovery lock connection")
+            print(e)
+            if self.leader_db is not None:
+                self.leader_db.discard_connection()
+            self.leader_db, self.leader = None, False
+        return self.leader
+
+    def lead(self, func):
+        """Wrap a discovery function so that it only runs on the leading worker."""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.is_leader():
+                return func(*args, **kwargs)
+        return wrapper
+
+
 def job():
     main()
 
 
+def run_scheduled(scheduled_job: schedule.Job, name: str, func):
+    """Run a scheduled function as a metrics cycle, recording how late it started compared to its slot."""
+    lag = max(0.0, (datetime.now() - scheduled_job.next_run).total_seconds())
+    with metrics.cycle(name, lag=lag):
+        func()
+
+
+def every_minute(name: str, func) -> schedule.Job:
+    scheduled_job = schedule.every(1).minutes
+    return scheduled_job.do(run_scheduled, scheduled_job, name, func)
+
+
 if __name__ == "__main__":
-    schedule.every(1).minutes.do(job)
-    schedule.every(1).minutes.do(check_swaps)
+    parser = argparse.ArgumentParser(description="FixedFloat swap monitor")
+    parser.add_argument('--tail', action='store_true',
+                        help="follow the hot wallet from a block checkpoint instead of rescanning it every minute")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="check fresh addresses every few seconds and back idle ones off, instead of every minute")
+    parser.add_argument('--worker', action='store_true',
+                        help="like --adaptive, sharing the watchlist with the other workers on the same database")
+    args = parser.parse_args()
+
+    config = Config("credentials.yml")
+    if config.get_value('Monitor.METRICS_PORT', None):
+        metrics.serve(int(config.get_value('Monitor.METRICS_PORT')))
+    if config.get_value('Monitor.METRICS_LOG', None):
+        metrics.open_log(config.get_value('Monitor.METRICS_LOG'))
+
+    worker = MonitorWorker.from_config(config) if args.worker else None
+    alerts.start(config)
+    if args.tail:
+        tailer = HotWalletTailer.from_config(config)
+        if worker:
+            tailer.poll = worker.lead(tailer.poll)
+        Thread(target=tailer.run, daemon=True).start()
+    else:
+        every_minute('discovery', worker.lead(job) if worker else job)
+    if worker:
+        Thread(target=worker.run, daemon=True).start()
+    elif args.adaptive:
+        scheduler = AdaptiveScheduler.from_config(config)
+        Thread(target=scheduler.run, daemon=True).start()
+    else:
+        every_minute('check_swaps', check_swaps)
 
     while True:
         schedule.run_pending()
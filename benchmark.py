@@ -0,0 +1,544 @@
+from contextlib import redirect_stderr, redirect_stdout
+from synthetic_chain import HOT_WALLET, SyntheticChain
+from standin_server import StandInAPI, StandInServer
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from urllib.parse import urlparse
+import numpy as np
+import pandas as pd
+import tracemalloc
+import requests
+import argparse
+import tempfile
+import shutil
+import random
+import json
+import time
+import sys
+import io
+import os
+
+BENCHMARK_KEY = 'benchmark'
+
+
+class FakeResponse:
+    def __init__(self, data, status_code: int = 200):
+        self.data = data
+        self.status_code = status_code
+
+    @property
+    def text(self) -> str:
+        return json.dumps(self.data)
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+
+class FakeSession:
+    """`requests` look-alike answering from a `StandInAPI` in-process, without any socket."""
+
+    def __init__(self, api: StandInAPI):
+        self.api = api
+
+    def Session(self) -> "FakeSession":
+        return self
+
+    def mount(self, prefix, adapter) -> None:
+        pass
+
+    def request(self, method: str, url: str, params=None, json=None, **kwargs) -> FakeResponse:
+        params = dict(params or {})
+        if json is not None:
+            params.update({'batch': json} if isinstance(json, list) else json)
+        status, data = self.api.handle(method.upper(), urlparse(url).path, params)
+        return FakeResponse(data, status)
+
+    def get(self, url: str, params=None, **kwargs) -> FakeResponse:
+        return self.request('GET', url, params, **kwargs)
+
+    def post(self, url: str, json=None, **kwargs) -> FakeResponse:
+        return self.request('POST', url, json=json, **kwargs)
+
+
+class MemoryDB:
+    """In-memory stand-in for `FixedFloat.DBManager`, shared by all its instances."""
+    addresses: List[str] = []
+    transactions: List[str] = []
+    checkpoints: Dict[str, int] = {}
+    alerts: List[str] = []
+    address_meta: Dict[str, tuple] = {}
+    leases: Dict[str, tuple] = {}
+    lock = Lock()
+
+    def __init__(self, db_name=None, user=None, password=None, host=None):
+        pass
+
+    @classmethod
+    def reset(cls, addresses=()) -> None:
+        cls.addresses = list(addresses)
+        cls.transactions = []
+        cls.checkpoints = {}
+        cls.alerts = []
+        cls.address_meta = {}
+        cls.leases = {}
+
+    def insert_address(self, address):
+        if address not in self.addresses:
+            self.addresses.append(address)
+
+    def insert_transaction(self, txhash):
+        self.transactions.append(txhash)
+
+    def get_all_addresses(self):
+        return list(self.addresses)
+
+    def get_all_transactions(self):
+        return list(self.transactions)
+
+    def get_checkpoint(self, name):
+        return self.checkpoints.get(name)
+
+    def set_checkpoint(self, name, block):
+        self.checkpoints[name] = max(block, self.checkpoints.get(name, block))
+
+    def remove_address(self, address):
+        if address in self.addresses:
+            self.addresses.remove(address)
+        self.address_meta.pop(address, None)
+
+    def get_address_meta(self):
+        return dict(self.address_meta)
+
+    def save_address_meta(self, rows):
+        self.address_meta.update((row[0], row) for row in rows)
+        for row in rows:
+            self.leases.pop(('address', row[0]), None)
+
+    def get_pending_alerts(self):
+        return list(self.alerts)
+
+    def remove_alert(self, txhash):
+        if txhash in self.alerts:
+            self.alerts.remove(txhash)
+
+    def claim_swap(self, txhash):
+        with self.lock:
+            if txhash in self.transactions:
+                return False
+            self.transactions.append(txhash)
+            self.alerts.append(txhash)
+            return True
+
+    def claim_alert(self, txhash, worker, lease):
+        return self._lease(('alert', txhash), worker, lease) and txhash in self.alerts
+
+    def release_alert(self, txhash):
+        self.leases.pop(('alert', txhash), None)
+
+    def _lease(self, key, worker, lease) -> bool:
+        with self.lock:
+            holder, until = self.leases.get(key, (None, 0))
+            if holder not in (None, worker) and until >= time.time():
+                return False
+            self.leases[key] = (worker, time.time() + lease)
+            return True
+
+    def add_missing_address_meta(self):
+        for address in self.addresses:
+            self.address_meta.setdefault(address, (address, None, None, None, None, 0))
+
+    def claim_addresses(self, worker, lease, limit):
+        with self.lock:
+            now = time.time()
+            due = sorted((row for row in self.address_meta.values() if row[5] <= now
+                          and self.leases.get(('address', row[0]), (None, 0))[1] < now), key=lambda row: row[5])
+            for row in due[:limit]:
+                self.leases[('address', row[0])] = (worker, now + lease)
+            return due[:limit]
+
+    def try_advisory_lock(self, key):
+        return self._lease(('advisory', key), id(self), float('inf'))
+
+    def holds_advisory_lock(self, key):
+        with self.lock:
+            return self.leases.get(('advisory', key), (None, 0))[0] == id(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+    def close_connection(self):
+        pass
+
+    def discard_connection(self):
+        pass
+
+
+def write_zerion_exports(folder: str, files: int, rows: int, seed: int = 0) -> int:
+    """Zerion-style CSV exports mixing trades, transfers, failed and non-Ethereum rows. Returns the row count."""
+    rng = np.random.default_rng(seed)
+    tokens = np.array([f'TKN{i}' for i in range(200)] + ['ETH\nWETH', 'USDC'])
+    os.makedirs(folder, exist_ok=True)
+    for i in range(files):
+        is_buy = rng.random(rows) < 0.55
+        token = rng.choice(tokens, rows)
+        times = pd.Timestamp('2023-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 365 * 86400, rows)), unit='s')
+        pd.DataFrame({
+            'Date': times.strftime('%Y-%m-%d'),
+            'Time': times.strftime('%H:%M:%S'),
+            'Transaction Type': rng.choice(['trade', 'trade', 'trade', 'receive', 'send'], rows),
+            'Status': rng.choice(['Confirmed'] * 9 + ['Failed'], rows),
+            'Chain': rng.choice(['ethereum'] * 4 + ['arbitrum'], rows),
+            'Application': 'Uniswap',
+            'Buy Amount': np.where(is_buy, rng.uniform(1, 1e6, rows).round(4), rng.uniform(0.01, 5, rows).round(6)),
+            'Buy Currency': np.where(is_buy, token, 'ETH'),
+            'Buy Fiat Amount': rng.uniform(1, 1e4, rows).round(2),
+            'Sell Amount': np.where(is_buy, rng.uniform(0.01, 5, rows).round(6), rng.uniform(1, 1e6, rows).round(4)),
+            'Sell Currency': np.where(is_buy, 'ETH', token),
+            'Sell Fiat Amount': rng.uniform(1, 1e4, rows).round(2),
+            'Fee Amount': rng.uniform(0.0005, 0.02, rows).round(6),
+            'Fee Currency': 'ETH',
+            'Tx Hash': [f'0x{value:064x}' for value in rng.integers(0, 2 ** 62, rows)],
+        }).to_csv(os.path.join(folder, f'wallet{i}.csv'), index=False)
+    return files * rows
+
+
+@dataclass
+class Case:
+    """A benchmark: `setup` prepares its input outside the timing, `run` returns the number of items processed."""
+    name: str
+    run: Callable
+    setup: Callable = lambda bench: None
+
+
+@dataclass
+class Result:
+    name: str
+    items: int
+    seconds: float
+    api_calls: int
+    peak_memory_mb: float
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.seconds if self.seconds else float('inf')
+
+
+class Bench:
+    """Working directory, synthetic chain and stand-in backends shared by the benchmarks.
+
+    The APIs are answered in-process by default; with `http` they go through a local `StandInServer`
+    that the scripts reach through their configured base URLs. `latency` delays every answer like a remote API.
+    """
+
+    def __init__(self, scale: float = 1.0, seed: int = 0, http: bool = False, latency: float = 0.0):
+        self.scale = scale
+        self.workdir = tempfile.mkdtemp(prefix='defi-bench-')
+        os.chdir(self.workdir)
+
+        self.chain = SyntheticChain(wallets=self.scaled(2000), hub_transactions=self.scaled(10_000), seed=seed)
+        self.api = StandInAPI(self.chain, latency=latency)
+        self.server = StandInServer(self.api, port=0) if http else None
+        self.zerion_rows = write_zerion_exports('zerion', files=8, rows=self.scaled(50_000), seed=seed)
+
+        config = {'Etherscan': {'API_KEY': BENCHMARK_KEY},
+                  'Telegram': {'TOKEN_ID': 'benchmark', 'CHAT_ID': '0', 'MESSAGES_PER_SECOND': 1e9},
+                  'FixedFloat': {'ADDRESS': HOT_WALLET},
+                  'Monitor': {'CONCURRENCY': 5}}
+        import FixedFloat
+        FixedFloat.DBManager = MemoryDB
+        if self.server:
+            self.server.start()
+            config['Etherscan']['BASE_URL'] = f"{self.server.url}/api"
+            config['Dexscreener'] = {'BASE_URL': self.server.url}
+            config['Telegram']['BASE_URL'] = self.server.url
+        else:
+            FixedFloat.requests = FakeSession(self.api)
+        with open('credentials.yml', 'w') as f:
+            json.dump(config, f)
+
+    def total_calls(self) -> int:
+        return sum(self.api.stats()['calls'].values())
+
+    def scaled(self, count: int) -> int:
+        return max(1, int(count * self.scale))
+
+    def reset(self) -> None:
+        """Start from an empty local state: no transaction store, graph, hub list or cached exports."""
+        import etherscan_client
+        import tx_store
+        import FixedFloat
+        for store in tx_store._stores.values():
+            store.close()
+        tx_store._stores.clear()
+        for path in ['transactions.db', 'ledger.db', 'hubs.json', 'contract_links.json']:
+            if os.path.exists(path):
+                os.remove(path)
+        for path in ['graph', 'zerion/cache', 'results']:
+            shutil.rmtree(path, ignore_errors=True)
+        os.makedirs('results')
+
+        # Every script gets the same unthrottled client, whatever base URL it asks for
+        etherscan_client._clients.clear()
+        if self.server:
+            client = etherscan_client.EtherscanClient(BENCHMARK_KEY, rate_per_key=1e9,
+                                                      base_url=f"{self.server.url}/api")
+            etherscan_client._clients[((BENCHMARK_KEY,), client.base_url)] = client
+        else:
+            client = etherscan_client.EtherscanClient(BENCHMARK_KEY, rate_per_key=1e9)
+            client.session = FakeSession(self.api)
+        etherscan_client._clients[((BENCHMARK_KEY,), etherscan_client.ETHERSCAN_URL)] = client
+
+        MemoryDB.reset()
+        FixedFloat.contract_links.links = None
+        FixedFloat._market_data.clear()
+        FixedFloat.processed_transactions.hashes = None
+
+    def measure(self, case: Case, repeat: int = 1) -> Result:
+        """Best wall time over `repeat` runs, API calls of one run, then peak memory from a traced run."""
+        timings = []
+        api_calls = items = 0
+        for _ in range(repeat):
+            self.reset()
+            state = case.setup(self)
+            calls = self.total_calls()
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+                items = case.run(self, state)
+            timings.append(time.perf_counter() - started)
+            api_calls = self.total_calls() - calls
+
+        self.reset()
+        state = case.setup(self)
+        tracemalloc.start()
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            case.run(self, state)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return Result(case.name, items, min(timings), api_calls, peak / 2 ** 20)
+
+    def close(self) -> None:
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        os.chdir(os.path.dirname(self.workdir))
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def hot_wallet_transactions(bench: Bench) -> List[dict]:
+    import FixedFloat
+    return FixedFloat.EtherscanAPI(BENCHMARK_KEY).get_transactions(HOT_WALLET)
+
+
+def recent_transfers(bench: Bench) -> List[dict]:
+    import FixedFloat
+    from datetime import datetime
+    transactions = hot_wallet_transactions(bench)
+    since = datetime.now() - FixedFloat.RECENT_TRANSFER_WINDOW
+    return [tx for tx in transactions if FixedFloat.is_qualifying_transfer(tx, HOT_WALLET, since)]
+
+
+def run_filter(bench: Bench, transactions: List[dict]) -> int:
+    import FixedFloat
+    from datetime import datetime
+    since = datetime.now() - FixedFloat.RECENT_TRANSFER_WINDOW
+    [tx for tx in transactions if FixedFloat.is_qualifying_transfer(tx, HOT_WALLET, since)]
+    return len(transactions)
+
+
+def run_screen(bench: Bench, transfers: List[dict]) -> int:
+    import FixedFloat
+    FixedFloat.screen_recipients(FixedFloat.EtherscanAPI(BENCHMARK_KEY), transfers)
+    return len(transfers)
+
+
+def run_main(bench: Bench, state) -> int:
+    import FixedFloat
+    FixedFloat.main()
+    return len(bench.chain.histories[HOT_WALLET])
+
+
+def setup_watchlist(bench: Bench) -> List[str]:
+    watchlist = random.Random(1).sample(bench.chain.wallets, min(len(bench.chain.wallets), bench.scaled(300)))
+    MemoryDB.reset(watchlist)
+    return watchlist
+
+
+def run_check_swaps(bench: Bench, watchlist: List[str]) -> int:
+    import FixedFloat
+    FixedFloat.check_swaps()
+    FixedFloat.alerts.join()  # include the alerts delivered in the background
+    return len(watchlist)
+
+
+def run_adaptive(bench: Bench, watchlist: List[str]) -> int:
+    """A first pass checks the whole watchlist like check_swaps, an immediate second one finds nothing due."""
+    import FixedFloat
+    scheduler = FixedFloat.AdaptiveScheduler(FixedFloat.EtherscanAPI(BENCHMARK_KEY))
+    checked = scheduler.run_pending() + scheduler.run_pending()
+    FixedFloat.alerts.join()
+    return checked
+
+
+def run_workers(bench: Bench, watchlist: List[str], workers: int = 3) -> int:
+    """Monitor workers sharing the watchlist in threads, each leasing batches until nothing is due."""
+    import FixedFloat
+
+    def work(worker: FixedFloat.MonitorWorker) -> int:
+        checked = 0
+        while True:
+            batch = worker.run_pending()
+            if not batch:
+                return checked
+            checked += batch
+
+    pool = [FixedFloat.MonitorWorker(FixedFloat.EtherscanAPI(BENCHMARK_KEY), worker_id=f'worker-{i}', batch_size=20)
+            for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        checked = sum(executor.map(work, pool))
+    FixedFloat.alerts.join()
+    return checked
+
+
+def link_endpoints(bench: Bench):
+    rng = random.Random(2)
+    starts = rng.sample(bench.chain.wallets, 5)
+    targets = {address: 'target' for address in rng.sample(bench.chain.wallets, 20)}
+    return starts, targets
+
+
+def run_find_hops(max_hops: int, bidirectional: bool = False) -> Callable:
+    def run(bench: Bench, endpoints) -> int:
+        import wallet_link
+        starts, targets = endpoints
+        search = wallet_link.find_hops_bidirectional if bidirectional else wallet_link.find_hops
+        expanded = 0
+        for start in starts:
+            cache = wallet_link.NeighborCache(max_transactions=100)
+            search(start, targets, max_hops=max_hops, max_transactions=100, cache=cache)
+            expanded += len(cache.adjacency)
+        return expanded
+    return run
+
+
+def heavy_wallet_transfers(bench: Bench) -> List[dict]:
+    import winratio_etherscan
+    wallet = bench.chain.wallets[0]
+    # A single tokentx call returns at most 10,000 rows
+    bench.chain.token_transfers(wallet, bench.scaled(10_000))
+    return winratio_etherscan.get_transactions(wallet, BENCHMARK_KEY)
+
+
+def run_parse_transactions(bench: Bench, transactions: List[dict]) -> int:
+    import winratio_etherscan
+    winratio_etherscan.parse_transactions(transactions, bench.chain.wallets[0])
+    return len(transactions)
+
+
+def run_score_wallets(bench: Bench, state) -> int:
+    import winratio_etherscan
+    wallets = bench.chain.wallets[1:1 + bench.scaled(100)]
+    transfers = winratio_etherscan.get_transfers(wallets, BENCHMARK_KEY)
+    winratio_etherscan.score_wallets(winratio_etherscan.aggregate_transfers(
+        winratio_etherscan.build_transfer_frame(transfers)), wallets)
+    return sum(len(rows) for rows in transfers.values())
+
+
+def run_zerion(bench: Bench, state) -> int:
+    import winratio_zerion
+    winratio_zerion.analyze_folder('zerion', results_dir='results')
+    return bench.zerion_rows
+
+
+def run_zerion_summary(bench: Bench, state) -> int:
+    import winratio_zerion
+    winratio_zerion.aggregate_wallets('zerion')
+    return bench.zerion_rows
+
+
+def ingest_zerion(bench: Bench) -> None:
+    import winratio_zerion
+    with redirect_stdout(io.StringIO()):
+        winratio_zerion.analyze_folder('zerion', results_dir='results')
+
+
+CASES = [
+    Case('fixedfloat.filter', run_filter, hot_wallet_transactions),
+    Case('fixedfloat.screen', run_screen, recent_transfers),
+    Case('fixedfloat.main', run_main),
+    Case('fixedfloat.check_swaps', run_check_swaps, setup_watchlist),
+    Case('fixedfloat.adaptive', run_adaptive, setup_watchlist),
+    Case('fixedfloat.workers', run_workers, setup_watchlist),
+    *[Case(f'wallet_link.find_hops[{hops}]', run_find_hops(hops), link_endpoints) for hops in (1, 2, 3)],
+    *[Case(f'wallet_link.bidirectional[{hops}]', run_find_hops(hops, True), link_endpoints) for hops in (1, 2, 3)],
+    Case('winratio_etherscan.parse_transactions', run_parse_transactions, heavy_wallet_transfers),
+    Case('winratio_etherscan.score_wallets', run_score_wallets),
+    Case('winratio_zerion.analyze_folder', run_zerion),
+    Case('winratio_zerion.analyze_folder[cached]', run_zerion, ingest_zerion),
+    Case('winratio_zerion.summary', run_zerion_summary, ingest_zerion),
+]
+
+
+def print_results(results: List[Result], baseline: Optional[Dict[str, dict]] = None) -> None:
+    header = f"{'benchmark':<42}{'items':>9}{'seconds':>10}{'items/s':>12}{'API calls':>11}{'peak MiB':>10}"
+    print(header + ('  vs baseline' if baseline else ''))
+    for result in results:
+        line = (f"{result.name:<42}{result.items:>9}{result.seconds:>10.3f}{result.throughput:>12.0f}"
+                f"{result.api_calls:>11}{result.peak_memory_mb:>10.1f}")
+        if baseline and result.name in baseline:
+            line += f"  {result.seconds / baseline[result.name]['seconds']:.2f}x time"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the hot paths on synthetic chain data")
+    parser.add_argument('cases', nargs='*', help="only run the benchmarks whose name contains one of these")
+    parser.add_argument('--scale', type=float, default=1.0, help="size of the synthetic data (1.0 = 10k-tx hubs)")
+    parser.add_argument('--repeat', type=int, default=1, help="timed runs per benchmark, the best one is kept")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--http', action='store_true',
+                        help="go through a local stand-in HTTP server instead of answering in-process")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds added to every stand-in API answer, to weigh waiting against computing")
+    parser.add_argument('--output', help="save the results as JSON, e.g. to compare later runs against")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="with --baseline, exit with an error if a benchmark is this many times slower")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    bench = Bench(args.scale, args.seed, args.http, args.latency)
+    try:
+        cases = [case for case in CASES if not args.cases or any(name in case.name for name in args.cases)]
+        results = []
+        for case in cases:
+            results.append(bench.measure(case, args.repeat))
+            print(f"{case.name}: {results[-1].seconds:.3f}s", file=sys.stderr)
+    finally:
+        bench.close()
+
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = {result['name']: result for result in json.load(f)}
+    print_results(results, baseline)
+    if output:
+        with open(output, 'w') as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+
+    if baseline:
+        regressions = [result.name for result in results if result.name in baseline
+                       and result.seconds > baseline[result.name]['seconds'] * args.tolerance]
+        if regressions:
+            print(f"\nSlower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
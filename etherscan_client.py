@@ -0,0 +1,101 @@
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Optional, Union
+from itertools import cycle
+from metrics import metrics
+from threading import Lock
+import requests
+import time
+
+ETHERSCAN_URL = "https://api.etherscan.io/api"
+
+
+class RateLimitError(Exception):
+    """Raised when Etherscan keeps answering with a rate-limit error after all retries."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available, then consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EtherscanClient:
+    """Etherscan client with a pooled keep-alive session, per-key rate limiting and round-robin keys."""
+
+    def __init__(self, api_keys: Union[str, List[str]], rate_per_key: float = 5, max_retries: int = 5,
+                 backoff: float = 0.5, pool_size: int = 16, timeout: float = 30, base_url: str = ETHERSCAN_URL):
+        self.api_keys = [api_keys] if isinstance(api_keys, str) else list(api_keys)
+        self.buckets = {key: TokenBucket(rate_per_key) for key in self.api_keys}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.base_url = base_url
+        self._keys = cycle(self.api_keys)
+        self._keys_lock = Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _next_key(self) -> str:
+        with self._keys_lock:
+            return next(self._keys)
+
+    @staticmethod
+    def _is_rate_limited(data: dict) -> bool:
+        result = data.get('result')
+        return isinstance(result, str) and 'rate limit' in result.lower()
+
+    def get(self, **params) -> dict:
+        """Call the Etherscan API with the given query parameters and return the decoded JSON."""
+        endpoint = params.get('action', '')
+        for attempt in range(self.max_retries + 1):
+            key = self._next_key()
+            with metrics.timer('rate_limit_wait_seconds', service='etherscan'):
+                self.buckets[key].acquire()
+            with metrics.request('etherscan', endpoint):
+                response = self.session.get(self.base_url, params={**params, 'apikey': key}, timeout=self.timeout)
+                if response.status_code != 429:
+                    response.raise_for_status()
+                    data = response.json()
+            if response.status_code != 429 and not self._is_rate_limited(data):
+                return data
+            metrics.inc('api_rate_limited_total', service='etherscan', endpoint=endpoint)
+            time.sleep(self.backoff * 2 ** attempt)
+        raise RateLimitError(f"Etherscan rate limit still exceeded after {self.max_retries} retries: {params}")
+
+    def get_result(self, **params):
+        """Shortcut for `get` returning only the `result` field (an empty list when missing)."""
+        return self.get(**params).get('result', [])
+
+
+_clients: Dict[tuple, EtherscanClient] = {}
+_clients_lock = Lock()
+
+
+def get_client(api_keys: Union[str, List[str]], base_url: str = ETHERSCAN_URL) -> EtherscanClient:
+    """Return the process-wide client for a key (or list of keys) and API URL, creating it on first use."""
+    keys = (api_keys,) if isinstance(api_keys, str) else tuple(api_keys)
+    with _clients_lock:
+        if (keys, base_url) not in _clients:
+            _clients[(keys, base_url)] = EtherscanClient(list(keys), base_url=base_url)
+        return _clients[(keys, base_url)]
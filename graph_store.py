@@ -0,0 +1,240 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from threading import RLock
+from pathlib import Path
+from array import array
+import struct
+import mmap
+import json
+import os
+
+ADDRESS_SIZE = 20
+TX_HASH_SIZE = 32
+FORMAT_VERSION = 2
+EDGE = struct.Struct('=III')  # source id, neighbor id, tx id
+NODE = struct.Struct('=IIIB')  # node id, transaction count, highest block added, truncated
+
+Adjacency = Tuple[List[Tuple[str, str]], int]
+
+
+def _to_bytes(value: str, size: int) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith('0x') else value).rjust(size, b'\0')
+
+
+def _map(path: Path, typecode: str):
+    """Memory-map a file read-only as an array of `typecode` items (None for a missing or empty file)."""
+    if not path.exists() or path.stat().st_size == 0:
+        return None
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+
+class GraphStore:
+    """Persistent transaction graph with interned addresses and memory-mapped CSR adjacency.
+
+    Addresses are stored as 20-byte binaries and referred to by integer id, tx hashes as 32-byte binaries.
+    Edges are appended to a log; `compact` turns the log into compressed-sparse-row arrays
+    (`indptr`, `indices`, `edge_tx`) that are memory-mapped, while edges appended since the last
+    compaction are served from memory. Only addresses whose transactions were added are considered
+    fetched. Each of them records the highest block added, so that newer transactions can be appended
+    later. An address whose history was only partly downloaded keeps its transaction count and no edges,
+    and is reported as truncated. Files use the machine's native byte order.
+    """
+
+    def __init__(self, path: str = "graph"):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.lock = RLock()
+        self._load()
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _load(self):
+        addresses = self._file('addresses.bin').read_bytes() if self._file('addresses.bin').exists() else b''
+        self.addresses = [addresses[i:i + ADDRESS_SIZE] for i in range(0, len(addresses), ADDRESS_SIZE)]
+        self.ids = {address: node_id for node_id, address in enumerate(self.addresses)}
+
+        meta = json.loads(self._file('meta.json').read_text()) if self._file('meta.json').exists() else {}
+        if self._file('nodes.bin').exists() and meta.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{self.path} was written by an older version, recreate it with --rebuild-graph")
+        if not meta:
+            self._file('meta.json').write_text(json.dumps({'csr_edges': 0, 'version': FORMAT_VERSION}))
+
+        self.nodes = {}  # node id -> (transaction count, highest block added, truncated)
+        if self._file('nodes.bin').exists():
+            for node_id, count, block, truncated in NODE.iter_unpack(self._file('nodes.bin').read_bytes()):
+                self.nodes[node_id] = (count, block, bool(truncated))
+
+        self.csr_edges = meta.get('csr_edges', 0)
+        self.indptr = _map(self._file('indptr.bin'), 'Q')
+        self.indices = _map(self._file('indices.bin'), 'I')
+        self.edge_tx = _map(self._file('edge_tx.bin'), 'I')
+        self.tx_hashes = _map(self._file('txhashes.bin'), 'B')
+        self.tx_count = self._file('txhashes.bin').stat().st_size // TX_HASH_SIZE \
+            if self._file('txhashes.bin').exists() else 0
+
+        # Edges appended after the last compaction
+        self.delta = {}
+        if self._file('edges.bin').exists():
+            with open(self._file('edges.bin'), 'rb') as f:
+                f.seek(self.csr_edges * EDGE.size)
+                for source, neighbor, tx_id in EDGE.iter_unpack(f.read()):
+                    self.delta.setdefault(source, []).append((neighbor, tx_id))
+        self.edge_count = self.csr_edges + sum(len(edges) for edges in self.delta.values())
+        self.pending_hashes = []
+
+    def _intern(self, address: str, new_addresses: List[bytes]) -> int:
+        key = _to_bytes(address.lower(), ADDRESS_SIZE)
+        node_id = self.ids.get(key)
+        if node_id is None:
+            node_id = len(self.addresses)
+            self.addresses.append(key)
+            self.ids[key] = node_id
+            new_addresses.append(key)
+        return node_id
+
+    def intern(self, address: str) -> int:
+        """Return the id of an address, assigning the next free id to new addresses."""
+        with self.lock:
+            new_addresses = []
+            node_id = self._intern(address, new_addresses)
+            with open(self._file('addresses.bin'), 'ab') as f:
+                f.write(b''.join(new_addresses))
+            return node_id
+
+    def address(self, node_id: int) -> str:
+        return '0x' + self.addresses[node_id].hex()
+
+    def _tx_hash(self, tx_id: int) -> str:
+        if tx_id < len(self.tx_hashes or ()) // TX_HASH_SIZE:
+            start = tx_id * TX_HASH_SIZE
+            return '0x' + bytes(self.tx_hashes[start:start + TX_HASH_SIZE]).hex()
+        return '0x' + self.pending_hashes[tx_id - len(self.tx_hashes or ()) // TX_HASH_SIZE].hex()
+
+    def has(self, address: str) -> bool:
+        """Whether the address's transactions have been added."""
+        node_id = self.ids.get(_to_bytes(address.lower(), ADDRESS_SIZE))
+        return node_id is not None and node_id in self.nodes
+
+    def sync_state(self, address: str) -> Optional[Tuple[int, bool]]:
+        """Highest block added for a fetched address and whether its history is truncated, or None."""
+        node_id = self.ids.get(_to_bytes(address.lower(), ADDRESS_SIZE))
+        if node_id is None or node_id not in self.nodes:
+            return None
+        _, block, truncated = self.nodes[node_id]
+        return block, truncated
+
+    def _write_node(self, source: int, count: int, block: int, truncated: bool) -> None:
+        with open(self._file('nodes.bin'), 'ab') as f:
+            f.write(NODE.pack(source, count, block, truncated))
+        self.nodes[source] = (count, block, truncated)
+
+    def add_transactions(self, address: str, transactions: List[dict], complete: bool = True) -> None:
+        """Append an address's transactions (or new ones since the last call) to the graph.
+
+        With `complete=False` the transactions are only the start of the history: just their number is
+        kept, until the complete history is added.
+        """
+        with self.lock:
+            new_addresses = []
+            source = self._intern(address, new_addresses)
+            count, block, truncated = self.nodes.get(source, (0, 0, True))
+            if not complete:
+                if source not in self.nodes or truncated:
+                    with open(self._file('addresses.bin'), 'ab') as f:
+                        f.write(b''.join(new_addresses))
+                    self._write_node(source, len(transactions), 0, True)
+                return
+            if truncated:
+                count = 0
+            edges, hashes = [], []
+            for transaction in transactions:
+                tx_id = self.tx_count + len(hashes)
+                hashes.append(_to_bytes(transaction['hash'], TX_HASH_SIZE))
+                for neighbor in (transaction['to'], transaction['from']):
+                    if neighbor:
+                        edges.append((self._intern(neighbor, new_addresses), tx_id))
+
+            with open(self._file('addresses.bin'), 'ab') as f:
+                f.write(b''.join(new_addresses))
+            with open(self._file('txhashes.bin'), 'ab') as f:
+                f.write(b''.join(hashes))
+            with open(self._file('edges.bin'), 'ab') as f:
+                f.write(b''.join(EDGE.pack(source, neighbor, tx_id) for neighbor, tx_id in edges))
+            block = max([block] + [int(transaction['blockNumber']) for transaction in transactions])
+            self._write_node(source, count + len(transactions), block, False)
+
+            self.tx_count += len(hashes)
+            self.pending_hashes.extend(hashes)
+            self.delta.setdefault(source, []).extend(edges)
+            self.edge_count += len(edges)
+
+    def neighbors(self, address: str) -> Optional[Adjacency]:
+        """`(neighbor, tx_hash)` edges of a fetched address and its transaction count, or None if not fetched.
+
+        A truncated address has no edges, see `sync_state`.
+        """
+        with self.lock:
+            node_id = self.ids.get(_to_bytes(address.lower(), ADDRESS_SIZE))
+            if node_id is None or node_id not in self.nodes:
+                return None
+            edges = []
+            if self.indptr is not None and node_id + 1 < len(self.indptr):
+                for i in range(self.indptr[node_id], self.indptr[node_id + 1]):
+                    edges.append((self.indices[i], self.edge_tx[i]))
+            edges.extend(self.delta.get(node_id, []))
+            return ([(self.address(neighbor), self._tx_hash(tx_id)) for neighbor, tx_id in edges],
+                    self.nodes[node_id][0])
+
+    def compact(self) -> None:
+        """Rebuild the CSR arrays from the whole edge log, keeping each address's edges in insertion order."""
+        with self.lock:
+            node_count = len(self.addresses)
+            sources, neighbors, tx_ids = array('I'), array('I'), array('I')
+            if self._file('edges.bin').exists():
+                for source, neighbor, tx_id in EDGE.iter_unpack(self._file('edges.bin').read_bytes()):
+                    sources.append(source)
+                    neighbors.append(neighbor)
+                    tx_ids.append(tx_id)
+
+            indptr = array('Q', [0]) * (node_count + 1)
+            for source in sources:
+                indptr[source + 1] += 1
+            for i in range(node_count):
+                indptr[i + 1] += indptr[i]
+            position = array('Q', indptr[:-1]) if node_count else array('Q')
+            indices = array('I', [0]) * len(sources)
+            edge_tx = array('I', [0]) * len(sources)
+            for source, neighbor, tx_id in zip(sources, neighbors, tx_ids):
+                indices[position[source]] = neighbor
+                edge_tx[position[source]] = tx_id
+                position[source] += 1
+
+            self.close()
+            for name, values in (('indptr.bin', indptr), ('indices.bin', indices), ('edge_tx.bin', edge_tx)):
+                with open(self._file(name + '.tmp'), 'wb') as f:
+                    values.tofile(f)
+                os.replace(self._file(name + '.tmp'), self._file(name))
+            self._file('meta.json').write_text(json.dumps({'csr_edges': len(sources), 'version': FORMAT_VERSION}))
+            self._load()
+
+    @classmethod
+    def rebuild(cls, path: str, histories: Iterable[Tuple[str, List[dict]]]) -> "GraphStore":
+        """Create a fresh store at `path` from `(address, transactions)` pairs and compact it."""
+        for name in ('addresses.bin', 'txhashes.bin', 'edges.bin', 'nodes.bin', 'indptr.bin', 'indices.bin',
+                     'edge_tx.bin', 'meta.json'):
+            Path(path, name).unlink(missing_ok=True)
+        store = cls(path)
+        for address, transactions in histories:
+            store.add_transactions(address, transactions)
+        store.compact()
+        return store
+
+    def close(self) -> None:
+        """Drop the memory maps; the store can be reopened with a new `GraphStore`."""
+        self.indptr = self.indices = self.edge_tx = self.tx_hashes = None
+
+    def stats(self) -> Dict[str, int]:
+        return {'addresses': len(self.addresses), 'fetched': len(self.nodes),
+                'edges': self.edge_count, 'transactions': self.tx_count}
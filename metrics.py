@@ -0,0 +1,216 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+from threading import Lock, Thread, local
+from functools import wraps
+from typing import Dict, Optional, Tuple
+import bisect
+import json
+import time
+
+NAMESPACE = 'defi'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms, exposed in the Prometheus text format.
+
+    Work done inside `cycle` (one scheduled run) is also summed per stage and per API endpoint, and written
+    as one JSON line per cycle when a log file is open.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = Lock()
+        self.counters: Dict[tuple, float] = defaultdict(float)
+        self.histograms: Dict[tuple, list] = {}
+        self.log = None
+        self.current = local()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self.lock:
+            self.counters[self._key(name, labels)] += value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram = self.histograms[key]
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+            histogram[-1] += value
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @contextmanager
+    def stage(self, stage: str):
+        """Time one stage of the monitor, e.g. fetch, prior_activity, contract_filter, db_write or alerting."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe('stage_seconds', elapsed, stage=stage)
+            stages = getattr(self.current, 'stages', None)
+            if stages is not None:
+                with self.lock:
+                    stages[stage] += elapsed
+
+    def timed(self, stage: str):
+        """Decorator running the whole function as a `stage`."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def request(self, service: str, endpoint: str):
+        """Count and time one API request; an exception counts as an error."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('api_errors_total', service=service, endpoint=endpoint)
+            raise
+        finally:
+            self.inc('api_requests_total', service=service, endpoint=endpoint)
+            self.observe('api_request_seconds', time.perf_counter() - started, service=service, endpoint=endpoint)
+            requests = getattr(self.current, 'requests', None)
+            if requests is not None:
+                with self.lock:
+                    requests[f'{service}.{endpoint}'] += 1
+
+    def propagate(self, func):
+        """Wrap `func` so that what it does in a worker thread counts towards the caller's current cycle."""
+        stages = getattr(self.current, 'stages', None)
+        requests = getattr(self.current, 'requests', None)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            previous = getattr(self.current, 'stages', None), getattr(self.current, 'requests', None)
+            self.current.stages, self.current.requests = stages, requests
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.current.stages, self.current.requests = previous
+        return wrapper
+
+    def cache(self, cache: str, hit: bool) -> None:
+        self.inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+    @contextmanager
+    def cycle(self, job: str, lag: Optional[float] = None):
+        """One run of a scheduled job: records its duration, its schedule lag and a JSON-lines summary."""
+        if lag is not None:
+            self.observe('schedule_lag_seconds', lag, job=job)
+        self.current.stages = defaultdict(float)
+        self.current.requests = Counter()
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = repr(e)
+            self.inc('cycle_errors_total', job=job)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe('cycle_seconds', elapsed, job=job)
+            self.write_event({'event': 'cycle', 'job': job, 'started': time.time() - elapsed,
+                              'seconds': round(elapsed, 4), 'lag': lag,
+                              'stages': {stage: round(seconds, 4) for stage, seconds in self.current.stages.items()},
+                              'requests': dict(self.current.requests), 'error': error})
+            self.current.stages = self.current.requests = None
+
+    def open_log(self, path: str) -> None:
+        self.log = open(path, 'a', buffering=1)
+
+    def write_event(self, event: dict) -> None:
+        if self.log is not None:
+            with self.lock:
+                self.log.write(json.dumps(event) + '\n')
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"'.replace('\n', ' ') for key, value in pairs) + '}'
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, list(values)) for key, values in self.histograms.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f'# TYPE {NAMESPACE}_{name} counter')
+                typed.add(name)
+            lines.append(f'{NAMESPACE}_{name}{self._labels(labels)} {value:g}')
+
+        hits = Counter()
+        totals = Counter()
+        for (name, labels), value in counters:
+            if name == 'cache_requests_total':
+                cache = dict(labels)['cache']
+                totals[cache] += value
+                hits[cache] += value if dict(labels)['result'] == 'hit' else 0
+        if totals:
+            lines.append(f'# TYPE {NAMESPACE}_cache_hit_ratio gauge')
+            for cache, total in sorted(totals.items()):
+                lines.append(f'{NAMESPACE}_cache_hit_ratio{{cache="{cache}"}} {hits[cache] / total:.4f}')
+
+        for (name, labels), values in histograms:
+            if name not in typed:
+                lines.append(f'# TYPE {NAMESPACE}_{name} histogram')
+                typed.add(name)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{NAMESPACE}_{name}_bucket{self._labels(labels, (("le", bound),))} {cumulative}')
+            lines.append(f'{NAMESPACE}_{name}_sum{self._labels(labels)} {values[-1]:.6f}')
+            lines.append(f'{NAMESPACE}_{name}_count{self._labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+        """Expose `render` at http://host:port/metrics from a daemon thread."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                payload = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+metrics = Metrics()
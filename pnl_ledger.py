@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from decimal import Decimal
+from threading import Lock
+import sqlite3
+
+DEFAULT_DB_PATH = "ledger.db"
+
+
+@dataclass
+class Trade:
+    """One buy or sell of `quantity` tokens for `value` ETH (0 when unknown) paying `fee` ETH."""
+    token: str
+    side: str  # 'buy' or 'sell'
+    quantity: Decimal
+    value: float = 0.0
+    fee: float = 0.0
+
+
+@dataclass
+class Position:
+    bought_quantity: Decimal = Decimal(0)
+    sold_quantity: Decimal = Decimal(0)
+    bought_value: float = 0.0
+    sold_value: float = 0.0
+    fees: float = 0.0
+    held_quantity: Decimal = Decimal(0)
+    cost_basis: float = 0.0
+    realized_pnl: float = 0.0
+    has_buy: bool = False
+
+
+class PnLLedger:
+    """Persistent per-wallet, per-token running totals that are updated with new trades only.
+
+    Each wallet has a cursor per source (a block number or a unix timestamp) marking the last trade applied,
+    so a refresh costs time proportional to the new activity. Realized PnL uses the average cost of the held
+    tokens, or their FIFO cost basis when `fifo` is set.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, fifo: bool = False):
+        self.fifo = fifo
+        self.lock = Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS positions
+                                 (wallet text, token text, bought_quantity text, sold_quantity text,
+                                  bought_value real, sold_value real, fees real, held_quantity text,
+                                  cost_basis real, realized_pnl real, has_buy integer,
+                                  PRIMARY KEY (wallet, token))''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS lots
+                                 (wallet text, token text, seq integer, quantity text, cost real,
+                                  PRIMARY KEY (wallet, token, seq))''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS cursors
+                                 (wallet text, source text, position integer, PRIMARY KEY (wallet, source))''')
+
+    def get_cursor(self, wallet: str, source: str) -> Optional[int]:
+        with self.lock:
+            row = self.conn.execute('SELECT position FROM cursors WHERE wallet=? AND source=?',
+                                    (wallet, source)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _position(row) -> Position:
+        return Position(Decimal(row[2]), Decimal(row[3]), row[4], row[5], row[6], Decimal(row[7]), row[8], row[9],
+                        bool(row[10]))
+
+    def get_positions(self, wallet: str) -> Dict[str, Position]:
+        with self.lock:
+            rows = self.conn.execute('SELECT * FROM positions WHERE wallet=?', (wallet,)).fetchall()
+        return {row[1]: self._position(row) for row in rows}
+
+    def _get_lots(self, wallet: str, token: str) -> List[list]:
+        rows = self.conn.execute('SELECT quantity, cost FROM lots WHERE wallet=? AND token=? ORDER BY seq',
+                                 (wallet, token)).fetchall()
+        return [[Decimal(quantity), cost] for quantity, cost in rows]
+
+    def _sell_cost(self, position: Position, quantity: Decimal, lots: Optional[List[list]]) -> float:
+        """Remove `quantity` from the held tokens and return the cost basis that leaves with it."""
+        if lots is None:
+            if position.held_quantity <= 0:
+                return 0.0
+            sold = min(quantity, position.held_quantity)
+            return position.cost_basis * float(sold / position.held_quantity)
+        cost = 0.0
+        while quantity > 0 and lots:
+            lot_quantity, lot_cost = lots[0]
+            taken = min(quantity, lot_quantity)
+            taken_cost = lot_cost * float(taken / lot_quantity)
+            cost += taken_cost
+            quantity -= taken
+            if taken == lot_quantity:
+                lots.pop(0)
+            else:
+                lots[0] = [lot_quantity - taken, lot_cost - taken_cost]
+        return cost
+
+    def apply(self, wallet: str, source: str, trades: List[Trade], position: int) -> None:
+        """Apply trades newer than the wallet's cursor, in order, and move the cursor to `position`."""
+        with self.lock:
+            positions = {}
+            lots = {}
+            for trade in trades:
+                if trade.token not in positions:
+                    row = self.conn.execute('SELECT * FROM positions WHERE wallet=? AND token=?',
+                                            (wallet, trade.token)).fetchone()
+                    positions[trade.token] = self._position(row) if row else Position()
+                    if self.fifo:
+                        lots[trade.token] = self._get_lots(wallet, trade.token)
+                current = positions[trade.token]
+                current.fees += trade.fee
+                if trade.side == 'buy':
+                    current.has_buy = True
+                    current.bought_quantity += trade.quantity
+                    current.bought_value += trade.value
+                    current.held_quantity += trade.quantity
+                    current.cost_basis += trade.value
+                    if self.fifo and trade.quantity > 0:
+                        lots[trade.token].append([trade.quantity, trade.value])
+                else:
+                    cost = self._sell_cost(current, trade.quantity, lots.get(trade.token))
+                    current.sold_quantity += trade.quantity
+                    current.sold_value += trade.value
+                    current.held_quantity = max(Decimal(0), current.held_quantity - trade.quantity)
+                    current.cost_basis = max(0.0, current.cost_basis - cost)
+                    current.realized_pnl += trade.value - cost
+
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                      [(wallet, token, str(p.bought_quantity), str(p.sold_quantity), p.bought_value,
+                                        p.sold_value, p.fees, str(p.held_quantity), p.cost_basis, p.realized_pnl,
+                                        int(p.has_buy)) for token, p in positions.items()])
+                for token, token_lots in lots.items():
+                    self.conn.execute('DELETE FROM lots WHERE wallet=? AND token=?', (wallet, token))
+                    self.conn.executemany('INSERT INTO lots VALUES (?, ?, ?, ?, ?)',
+                                          [(wallet, token, seq, str(quantity), cost)
+                                           for seq, (quantity, cost) in enumerate(token_lots)])
+                self.conn.execute('''INSERT INTO cursors VALUES (?, ?, ?)
+                                     ON CONFLICT (wallet, source) DO UPDATE SET position=excluded.position''',
+                                  (wallet, source, position))
+
+    def win_ratio(self, wallet: str, basis: str = 'value'):
+        """Tokens traded, wins and win ratio (None without tokens) of a wallet.
+
+        `basis='value'` matches winratio_zerion: every traded token counts and a win is ETH received above
+        ETH spent plus fees. `basis='quantity'` matches winratio_etherscan: only bought tokens count and a win
+        is more tokens sold than bought.
+        """
+        positions = self.get_positions(wallet).values()
+        if basis == 'quantity':
+            positions = [p for p in positions if p.has_buy]
+            wins = sum(p.sold_quantity > p.bought_quantity for p in positions)
+        else:
+            positions = list(positions)
+            wins = sum(p.sold_value > p.bought_value + p.fees for p in positions)
+        win_ratio = round(wins / len(positions) * 100, 2) if positions else None
+        return len(positions), wins, win_ratio
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,89 @@
+from requests.adapters import HTTPAdapter
+from etherscan_client import EtherscanClient
+from typing import Dict, Iterable, List, Optional, Set
+from threading import Lock
+from metrics import metrics
+import requests
+
+# keccak256('Transfer(address,address,uint256)')
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+
+
+def topic_address(topic: str) -> str:
+    """Address held by an indexed 32-byte log topic."""
+    return '0x' + topic[-40:].lower()
+
+
+def received_tokens(receipt: dict, address: str, exclude: Iterable[str] = ()) -> Set[str]:
+    """Contracts of the ERC-20 tokens transferred to `address` in a transaction, decoded from its Transfer logs.
+
+    ERC-721 transfers, which index the token id as a fourth topic, are ignored.
+    """
+    address = address.lower()
+    exclude = {token.lower() for token in exclude}
+    tokens = set()
+    for log in receipt.get('logs') or []:
+        topics = log.get('topics') or []
+        if len(topics) == 3 and topics[0].lower() == TRANSFER_TOPIC and topic_address(topics[2]) == address:
+            token = log['address'].lower()
+            if token not in exclude:
+                tokens.add(token)
+    return tokens
+
+
+class EtherscanReceipts:
+    """Receipts through Etherscan's `proxy` module, one request per transaction."""
+
+    def __init__(self, client: EtherscanClient):
+        self.client = client
+
+    def get_receipts(self, txhashes: List[str]) -> Dict[str, Optional[dict]]:
+        return {txhash: self.client.get(module='proxy', action='eth_getTransactionReceipt', txhash=txhash).get('result')
+                for txhash in dict.fromkeys(txhashes)}
+
+
+class RpcReceipts:
+    """Receipts from an Ethereum JSON-RPC endpoint, requested in batches of up to `batch_size` transactions."""
+
+    def __init__(self, url: str, batch_size: int = 100, pool_size: int = 4, timeout: float = 30):
+        self.url = url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get_receipts(self, txhashes: List[str]) -> Dict[str, Optional[dict]]:
+        """Receipt of each transaction, None for those the node does not know."""
+        txhashes = list(dict.fromkeys(txhashes))
+        receipts = {}
+        for i in range(0, len(txhashes), self.batch_size):
+            batch = txhashes[i:i + self.batch_size]
+            payload = [{'jsonrpc': '2.0', 'id': id, 'method': 'eth_getTransactionReceipt', 'params': [txhash]}
+                       for id, txhash in enumerate(batch)]
+            with metrics.request('rpc', 'eth_getTransactionReceipt'):
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                answers = response.json()
+            if isinstance(answers, dict):
+                # A node refusing the whole batch answers with a single error
+                raise RuntimeError(f"JSON-RPC batch refused by {self.url}: {answers.get('error')}")
+            results = {answer.get('id'): answer.get('result') for answer in answers}
+            for id, txhash in enumerate(batch):
+                receipts[txhash] = results.get(id)
+        return receipts
+
+
+_rpc_backends: Dict[str, RpcReceipts] = {}
+_rpc_backends_lock = Lock()
+
+
+def get_receipt_backend(client: EtherscanClient, rpc_url: Optional[str] = None):
+    """Receipts from the JSON-RPC endpoint when one is configured, otherwise through Etherscan."""
+    if not rpc_url:
+        return EtherscanReceipts(client)
+    with _rpc_backends_lock:
+        if rpc_url not in _rpc_backends:
+            _rpc_backends[rpc_url] = RpcReceipts(rpc_url)
+        return _rpc_backends[rpc_url]
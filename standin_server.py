@@ -0,0 +1,331 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from synthetic_chain import SyntheticChain
+from urllib.parse import urlparse, parse_qsl
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+from threading import Lock, Thread
+import argparse
+import sqlite3
+import random
+import json
+import time
+
+ETHERSCAN_MAX_RESULTS = 10000
+REPLAY_WINDOW = 3600
+
+
+class RecordedChain:
+    """Recorded Etherscan histories, with the same interface as `SyntheticChain`.
+
+    Receipts, balances, contract sources and Dexscreener pairs that were not recorded are generated.
+    """
+
+    def __init__(self, histories: Dict[str, List[dict]], token_transfers: Optional[Dict[str, List[dict]]] = None,
+                 receipts: Optional[dict] = None, balances: Optional[dict] = None, sources: Optional[dict] = None,
+                 pairs: Optional[dict] = None):
+        self.histories = defaultdict(list, histories)
+        self._token_transfers = token_transfers or {}
+        self.receipts = receipts or {}
+        self.balances = balances or {}
+        self.sources = sources or {}
+        self.pairs = pairs or {}
+
+    @classmethod
+    def load(cls, path: str) -> "RecordedChain":
+        """Read a JSON file with `txlist` and optionally `tokentx`, `receipts`, `balances`, `sources` and `pairs`."""
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data.get('txlist', {}), data.get('tokentx'), data.get('receipts'), data.get('balances'),
+                   data.get('sources'), data.get('pairs'))
+
+    @classmethod
+    def from_store(cls, db_path: str = "transactions.db") -> "RecordedChain":
+        """Serve the histories already synced into a `TransactionStore` database."""
+        histories = {'txlist': defaultdict(list), 'tokentx': defaultdict(list)}
+        conn = sqlite3.connect(db_path)
+        for address, action, data in conn.execute('''SELECT address, action, data FROM transactions
+                                                     ORDER BY block_number, rowid'''):
+            if action in histories:
+                histories[action][address].append(json.loads(data))
+        conn.close()
+        return cls(histories['txlist'], histories['tokentx'])
+
+    def token_transfers(self, address: str) -> List[dict]:
+        return self._token_transfers.get(address, [])
+
+    def receipt(self, txhash: str, sender: Optional[str] = None) -> dict:
+        return self.receipts.get(txhash) or SyntheticChain.receipt(txhash, sender)
+
+    def balance(self, address: str) -> int:
+        return int(self.balances[address]) if address in self.balances else SyntheticChain.balance(address)
+
+    def source_code(self, address: str) -> str:
+        return self.sources.get(address) or SyntheticChain.source_code(address)
+
+    def pair(self, address: str) -> dict:
+        return self.pairs.get(address) or SyntheticChain.pair(address)
+
+
+def latest_timestamp(chain) -> int:
+    return max((int(history[-1]['timeStamp']) for history in chain.histories.values() if history), default=0)
+
+
+class RateLimiter:
+    """Sliding-window limit of `rate` calls per `period` seconds for each caller."""
+
+    def __init__(self, rate: int, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self.calls = defaultdict(deque)
+        self.lock = Lock()
+
+    def allow(self, caller: str) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            calls = self.calls[caller]
+            while calls and calls[0] <= now - self.period:
+                calls.popleft()
+            if len(calls) >= self.rate:
+                return False
+            calls.append(now)
+            return True
+
+
+class ReplayClock:
+    """Simulated time starting at `start` and running `speed` times faster than the wall clock."""
+
+    def __init__(self, start: float, speed: float = 1.0):
+        self.start = start
+        self.speed = speed
+        self.started = time.time()
+
+    def now(self) -> float:
+        return self.start + (time.time() - self.started) * self.speed
+
+    def offset(self) -> int:
+        """Seconds to add to a simulated timestamp so that the simulated present reads as the real one."""
+        return int(time.time() - self.now())
+
+
+class StandInAPI:
+    """The Etherscan, Dexscreener, Telegram and JSON-RPC (`/rpc`) endpoints used by the scripts, answered from a chain.
+
+    `chain` is a `SyntheticChain` or a `RecordedChain`. Optional per-caller rate limits answer like the real
+    services (an Etherscan "Max rate limit reached" result, HTTP 429 for Dexscreener and Telegram), and each
+    request can be delayed by `latency` plus up to `jitter` seconds. With a `ReplayClock` only transactions
+    up to the simulated time are visible, and their timestamps are shifted to the present.
+    """
+
+    def __init__(self, chain, etherscan_rate: Optional[int] = None, dexscreener_rate: Optional[int] = None,
+                 telegram_rate: Optional[int] = None, latency: float = 0.0, jitter: float = 0.0,
+                 clock: Optional[ReplayClock] = None):
+        self.chain = chain
+        self.etherscan_limit = RateLimiter(etherscan_rate) if etherscan_rate else None
+        self.dexscreener_limit = RateLimiter(dexscreener_rate, 60) if dexscreener_rate else None
+        self.telegram_limit = RateLimiter(telegram_rate) if telegram_rate else None
+        self.latency = latency
+        self.jitter = jitter
+        self.clock = clock
+        self.calls = Counter()
+        self.messages = []
+        self.senders = None
+        self.lock = Lock()
+
+    def _count(self, name: str) -> None:
+        with self.lock:
+            self.calls[name] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'calls': dict(self.calls), 'messages': len(self.messages),
+                    'time': self.clock.now() if self.clock else time.time()}
+
+    def handle(self, method: str, path: str, params: dict) -> Tuple[int, dict]:
+        """Answer one request with an HTTP status and a JSON body."""
+        if path == '/stats':
+            return 200, self.stats()
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        if path.startswith('/latest/dex/tokens/'):
+            self._count('dexscreener')
+            if self.dexscreener_limit and not self.dexscreener_limit.allow('dexscreener'):
+                return 429, {'error': 'Too Many Requests'}
+            addresses = path.rsplit('/', 1)[1].lower().split(',')
+            return 200, {'schemaVersion': '1.0.0', 'pairs': [self.chain.pair(address) for address in addresses]}
+
+        if path.endswith('/sendMessage'):
+            self._count('telegram')
+            bot = path.split('/')[1]
+            if self.telegram_limit and not self.telegram_limit.allow(bot):
+                return 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                             'parameters': {'retry_after': 1}}
+            with self.lock:
+                self.messages.append(params.get('text', ''))
+                message_id = len(self.messages)
+            return 200, {'ok': True, 'result': {'message_id': message_id, 'chat': {'id': params.get('chat_id')},
+                                                'date': int(time.time()), 'text': params.get('text', '')}}
+
+        if path.rstrip('/') == '/rpc':
+            self._count('rpc')
+            calls = params['batch'] if 'batch' in params else [params]
+            answers = [self._rpc(call) for call in calls]
+            return 200, answers if 'batch' in params else answers[0]
+
+        if path.rstrip('/') in ('', '/api'):
+            return 200, self._etherscan(params)
+        return 404, {'error': f'Unknown endpoint {path}'}
+
+    def receipt(self, txhash: str) -> dict:
+        with self.lock:
+            if self.senders is None:
+                self.senders = {tx['hash']: tx['from'] for history in self.chain.histories.values() for tx in history}
+        return self.chain.receipt(txhash, self.senders.get(txhash))
+
+    def _rpc(self, call: dict) -> dict:
+        """Answer one JSON-RPC call; only `eth_getTransactionReceipt` is supported."""
+        if call.get('method') != 'eth_getTransactionReceipt':
+            return {'jsonrpc': '2.0', 'id': call.get('id'),
+                    'error': {'code': -32601, 'message': f"the method {call.get('method')} does not exist"}}
+        return {'jsonrpc': '2.0', 'id': call.get('id'), 'result': self.receipt(call['params'][0])}
+
+    def _etherscan(self, params: dict) -> dict:
+        action = params.get('action')
+        self._count(f"etherscan:{action}")
+        if self.etherscan_limit and not self.etherscan_limit.allow(params.get('apikey', '')):
+            return {'status': '0', 'message': 'NOTOK', 'result': 'Max rate limit reached'}
+
+        if action in ('txlist', 'tokentx'):
+            return self._list(params)
+        if action == 'balance':
+            return {'status': '1', 'message': 'OK', 'result': str(self.chain.balance(params['address'].lower()))}
+        if action == 'balancemulti':
+            balances = [{'account': address, 'balance': str(self.chain.balance(address.lower()))}
+                        for address in params['address'].split(',')]
+            return {'status': '1', 'message': 'OK', 'result': balances}
+        if action == 'eth_getTransactionReceipt':
+            return {'jsonrpc': '2.0', 'id': 1, 'result': self.receipt(params['txhash'])}
+        if action == 'getsourcecode':
+            return {'status': '1', 'message': 'OK',
+                    'result': [{'SourceCode': self.chain.source_code(params['address'].lower())}]}
+        return {'status': '0', 'message': 'NOTOK', 'result': f'Error! Unsupported action {action}'}
+
+    def _list(self, params: dict) -> dict:
+        address = params['address'].lower()
+        if params['action'] == 'txlist':
+            rows = self.chain.histories.get(address, [])
+        else:
+            rows = self.chain.token_transfers(address)
+
+        start_block = int(params.get('startblock', 0))
+        end_block = int(params.get('endblock', 99999999))
+        rows = [tx for tx in rows if start_block <= int(tx['blockNumber']) <= end_block]
+        if self.clock:
+            now, offset = self.clock.now(), self.clock.offset()
+            rows = [dict(tx, timeStamp=str(int(tx['timeStamp']) + offset)) for tx in rows
+                    if int(tx['timeStamp']) <= now]
+        if params.get('sort') == 'desc':
+            rows = rows[::-1]
+        if 'page' in params and 'offset' in params:
+            page, offset = int(params['page']), int(params['offset'])
+            rows = rows[(page - 1) * offset:page * offset]
+        rows = rows[:ETHERSCAN_MAX_RESULTS]
+        if not rows:
+            return {'status': '0', 'message': 'No transactions found', 'result': []}
+        return {'status': '1', 'message': 'OK', 'result': rows}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _respond(self, method: str) -> None:
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            body = self.rfile.read(length).decode()
+            if self.headers.get('Content-Type', '').startswith('application/json'):
+                body = json.loads(body)
+                params.update({'batch': body} if isinstance(body, list) else body)
+            else:
+                params.update(parse_qsl(body))
+
+        status, data = self.server.api.handle(method, url.path, params)
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    """HTTP server for a `StandInAPI`; port 0 picks a free port."""
+    daemon_threads = True
+
+    def __init__(self, api: StandInAPI, host: str = '127.0.0.1', port: int = 8080):
+        super().__init__((host, port), StandInHandler)
+        self.api = api
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> Thread:
+        """Serve from a daemon thread."""
+        thread = Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the Etherscan, Dexscreener and Telegram APIs")
+    parser.add_argument('--port', type=int, default=8080)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--data', help="serve a recorded JSON file (txlist, tokentx, receipts, balances, ...)")
+    source.add_argument('--store', help="serve the histories of a transactions.db file")
+    parser.add_argument('--scale', type=float, default=1.0, help="size of the generated chain without --data/--store")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument('--rate', type=int, default=5, help="Etherscan calls per second and key (0 = unlimited)")
+    parser.add_argument('--dexscreener-rate', type=int, default=300, help="Dexscreener calls per minute")
+    parser.add_argument('--telegram-rate', type=int, default=30, help="Telegram messages per second and bot")
+    parser.add_argument('--replay-speed', type=float,
+                        help="replay the data this many times faster than real time, revealing it as it happens")
+    parser.add_argument('--replay-from', type=int,
+                        help="unix time the replay starts at (default: one hour before the last transaction)")
+    args = parser.parse_args()
+
+    if args.data:
+        chain = RecordedChain.load(args.data)
+    elif args.store:
+        chain = RecordedChain.from_store(args.store)
+    else:
+        chain = SyntheticChain(wallets=max(1, int(2000 * args.scale)),
+                               hub_transactions=max(1, int(10_000 * args.scale)), seed=args.seed)
+
+    clock = None
+    if args.replay_speed:
+        start = args.replay_from if args.replay_from is not None else latest_timestamp(chain) - REPLAY_WINDOW
+        clock = ReplayClock(start, args.replay_speed)
+
+    server = StandInServer(StandInAPI(chain, args.rate or None, args.dexscreener_rate or None,
+                                      args.telegram_rate or None, args.latency, args.jitter, clock), port=args.port)
+    print(f"Serving on {server.url} - point credentials.yml at it with:\n"
+          f"Etherscan:\n  BASE_URL: {server.url}/api\n"
+          f"Dexscreener:\n  BASE_URL: {server.url}\n"
+          f"Telegram:\n  BASE_URL: {server.url}\n"
+          f"Call counts are at {server.url}/stats", flush=True)
+    server.serve_forever()
@@ -0,0 +1,148 @@
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+from receipts import TRANSFER_TOPIC
+import random
+import time
+
+HOT_WALLET = '0x4e5b2e1dc63f6b91cb6cd759936495434c7e972f'  # FixedFloat
+UNISWAP_ROUTER = '0x3fc91a3afd70395cd496c647d5a6cc9d4b2b7fad'
+WETH = '0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2'
+EXCHANGE = '0x28c6c06298d514db089934071355e5743bf21d60'  # Binance 14
+HUBS = [HOT_WALLET, UNISWAP_ROUTER, WETH, EXCHANGE]
+WEI = 10 ** 18
+FIRST_BLOCK = 17_000_000
+TRANSACTIONS_PER_BLOCK = 3
+BLOCK_TIME = 12
+
+
+def random_address(rng: random.Random) -> str:
+    return '0x%040x' % rng.getrandbits(160)
+
+
+def random_hash(rng: random.Random) -> str:
+    return '0x%064x' % rng.getrandbits(256)
+
+
+def transfer_log(token: str, sender: str, receiver: str, value: int) -> dict:
+    """ERC-20 `Transfer` event log."""
+    return {'address': token, 'topics': [TRANSFER_TOPIC, '0x' + sender[2:].rjust(64, '0'),
+                                         '0x' + receiver[2:].rjust(64, '0')], 'data': '0x%064x' % value}
+
+
+class SyntheticChain:
+    """Deterministic Ethereum activity with a heavy-tailed degree distribution.
+
+    Regular wallets get a Pareto-distributed number of transactions, with each other and with a few hubs
+    (the FixedFloat hot wallet, the Uniswap router, WETH and an exchange). Every hub is then padded with
+    transactions to fresh one-off addresses until it has `hub_transactions` of them. The latest blocks are
+    a few minutes old, so time windows behave as on the live chain. Token transfers, receipts, balances,
+    contract sources and Dexscreener pairs are generated on demand from the address or hash, so they are
+    the same on every run.
+    """
+
+    def __init__(self, wallets: int = 2000, hub_transactions: int = 10_000, token_transfers: int = 1000,
+                 seed: int = 0):
+        self.rng = random.Random(seed)
+        self.token_transfer_count = token_transfers
+        self.wallets = [random_address(self.rng) for _ in range(wallets)]
+        self.histories: Dict[str, List[dict]] = defaultdict(list)
+        self._token_transfers: Dict[str, List[dict]] = {}
+        self._build(hub_transactions)
+
+    def _build(self, hub_transactions: int) -> None:
+        rng = self.rng
+        events = []  # (from, to, value in wei, function name)
+        for wallet in self.wallets:
+            for _ in range(min(int(rng.paretovariate(1.2) * 2), 500)):
+                roll = rng.random()
+                if roll < 0.15:
+                    events.append((wallet, UNISWAP_ROUTER, rng.randrange(WEI // 100, 5 * WEI),
+                                   'execute(bytes commands,bytes[] inputs,uint256 deadline)'))
+                elif roll < 0.3:
+                    hub = rng.choice([WETH, EXCHANGE])
+                    events.append((hub, wallet, rng.randrange(WEI // 100, 20 * WEI), ''))
+                else:
+                    events.append((wallet, rng.choice(self.wallets), rng.randrange(0, 3 * WEI), ''))
+
+        hub_counts = Counter(address for event in events for address in event[:2] if address in HUBS)
+        for hub in HUBS:
+            for _ in range(hub_transactions - hub_counts[hub]):
+                leaf = random_address(rng)
+                if hub == HOT_WALLET:
+                    events.append((HOT_WALLET, leaf, rng.randrange(WEI // 20, 15 * WEI), ''))
+                    # Some recipients were active before, some deploy contracts
+                    roll = rng.random()
+                    if roll < 0.2:
+                        events.append((rng.choice(self.wallets), leaf, rng.randrange(0, WEI), ''))
+                    elif roll < 0.3:
+                        events.append((leaf, '', 0, ''))
+                else:
+                    events.append((leaf, hub, rng.randrange(0, 2 * WEI), ''))
+
+        rng.shuffle(events)
+        now = int(time.time())
+        last = len(events) // TRANSACTIONS_PER_BLOCK
+        for i, (sender, receiver, value, function_name) in enumerate(events):
+            block = i // TRANSACTIONS_PER_BLOCK
+            tx = {'blockNumber': str(FIRST_BLOCK + block), 'timeStamp': str(now - (last - block) * BLOCK_TIME),
+                  'hash': random_hash(rng), 'nonce': str(rng.randrange(1000)), 'blockHash': random_hash(rng),
+                  'transactionIndex': str(i % TRANSACTIONS_PER_BLOCK), 'from': sender, 'to': receiver,
+                  'value': str(value), 'gas': '250000', 'gasPrice': '30000000000', 'isError': '0',
+                  'txreceipt_status': '1', 'input': '0x3593564c' + '0' * 128 if function_name else '0x',
+                  'contractAddress': random_address(rng) if not receiver else '', 'cumulativeGasUsed': '8000000',
+                  'gasUsed': '21000', 'confirmations': str((last - block) + 12),
+                  'methodId': '0x3593564c' if function_name else '0x', 'functionName': function_name}
+            self.histories[sender].append(tx)
+            if receiver and receiver != sender:
+                self.histories[receiver].append(tx)
+
+    def token_transfers(self, address: str, count: Optional[int] = None) -> List[dict]:
+        """ERC-20 transfers in and out of an address, oldest first."""
+        if address not in self._token_transfers:
+            count = count or self.token_transfer_count
+            rng = random.Random(address)
+            tokens = [(random_address(rng), f'TKN{i}') for i in range(max(1, count // 20))]
+            transfers = []
+            for i in range(count):
+                contract, symbol = rng.choice(tokens)
+                counterparty = random_address(rng)
+                sender, receiver = (address, counterparty) if rng.random() < 0.45 else (counterparty, address)
+                transfers.append({'blockNumber': str(FIRST_BLOCK + i), 'timeStamp': str(1_680_000_000 + i * 12),
+                                  'hash': random_hash(rng), 'nonce': '0', 'blockHash': random_hash(rng),
+                                  'from': sender, 'contractAddress': contract, 'to': receiver,
+                                  'value': str(rng.getrandbits(rng.choice([40, 80, 120]))), 'tokenName': symbol,
+                                  'tokenSymbol': symbol, 'tokenDecimal': '18', 'transactionIndex': '0',
+                                  'gas': '200000', 'gasPrice': '30000000000', 'gasUsed': '60000',
+                                  'cumulativeGasUsed': '8000000', 'input': 'deprecated', 'confirmations': '100',
+                                  'logIndex': str(i % 7)})
+            self._token_transfers[address] = transfers
+        return self._token_transfers[address]
+
+    @staticmethod
+    def receipt(txhash: str, sender: Optional[str] = None) -> dict:
+        """Receipt of a swap of WETH for one or two tokens sent to `sender`, part of them going to a fee wallet."""
+        rng = random.Random(txhash)
+        sender = sender or random_address(rng)
+        pair = random_address(rng)
+        logs = [transfer_log(WETH, UNISWAP_ROUTER, pair, rng.randrange(WEI // 100, 5 * WEI))]
+        for _ in range(rng.randint(1, 2)):
+            token = random_address(rng)
+            logs.append(transfer_log(token, pair, sender, rng.getrandbits(80)))
+            logs.append(transfer_log(token, pair, random_address(rng), rng.getrandbits(70)))
+        return {'transactionHash': txhash, 'from': sender, 'to': UNISWAP_ROUTER, 'status': '0x1', 'logs': logs}
+
+    @staticmethod
+    def balance(address: str) -> int:
+        return random.Random(address).randrange(0, WEI)
+
+    @staticmethod
+    def source_code(address: str) -> str:
+        name = address[2:8]
+        return f"// {name}.io\n// https://t.me/{name} https://twitter.com/{name}\npragma solidity ^0.8.0;"
+
+    @staticmethod
+    def pair(address: str) -> dict:
+        rng = random.Random(address)
+        return {'baseToken': {'address': address, 'name': 'Token', 'symbol': 'TKN'}, 'fdv': rng.uniform(1e4, 1e8),
+                'priceUsd': str(rng.random()), 'volume': {'h24': rng.uniform(1e3, 1e7)},
+                'priceChange': {'h24': rng.uniform(-50, 50)}, 'pairCreatedAt': 1_690_000_000_000}
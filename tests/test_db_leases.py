@@ -0,0 +1,58 @@
+"""Lease and claim SQL of `DBManager`, against a scratch PostgreSQL database.
+
+Set TEST_DB_NAME (and TEST_DB_USER, TEST_DB_PASSWORD, TEST_DB_HOST as needed) to run them; the tables are
+emptied first.
+"""
+from FixedFloat import DBManager
+import pytest
+import time
+import os
+
+pytestmark = pytest.mark.skipif('TEST_DB_NAME' not in os.environ, reason='TEST_DB_NAME is not set')
+
+
+@pytest.fixture
+def db():
+    with DBManager(os.environ.get('TEST_DB_NAME'), os.environ.get('TEST_DB_USER'),
+                   os.environ.get('TEST_DB_PASSWORD'), os.environ.get('TEST_DB_HOST', 'localhost')) as db:
+        for table in ('addresses', 'transactions', 'address_meta', 'alert_outbox'):
+            db.c.execute(f'DELETE FROM {table}')
+        db.conn.commit()
+        yield db
+
+
+def test_claim_addresses_leases_due_rows_once(db):
+    now = time.time()
+    db.save_address_meta([('0xdue', None, None, 10, 60.0, now - 10), ('0xlater', None, None, 10, 60.0, now + 3600)])
+    db.insert_address('0xnew')
+    db.add_missing_address_meta()
+
+    claimed = {row[0]: row for row in db.claim_addresses('worker-1', lease=60, limit=10)}
+    assert sorted(claimed) == ['0xdue', '0xnew']
+    assert claimed['0xnew'] == ('0xnew', None, None, None, None, 0)
+    assert [row[0] for row in db.claim_addresses('worker-2', lease=60, limit=1)] == []
+
+    # Saving the checked row gives it back; an expired lease can be taken over
+    db.save_address_meta([('0xdue', None, None, 12, 60.0, now - 1)])
+    db.c.execute("UPDATE address_meta SET lease_until=%s WHERE address='0xnew'", (now - 1,))
+    db.conn.commit()
+    assert sorted(row[0] for row in db.claim_addresses('worker-2', lease=60, limit=10)) == ['0xdue', '0xnew']
+
+
+def test_claim_swap_and_alert_leases(db):
+    assert db.claim_swap('0xswap')
+    assert not db.claim_swap('0xswap')
+    assert db.get_all_transactions() == ['0xswap']
+    assert db.get_pending_alerts() == ['0xswap']
+
+    assert db.claim_alert('0xswap', 'worker-1', lease=60)
+    assert db.claim_alert('0xswap', 'worker-1', lease=60)
+    assert not db.claim_alert('0xswap', 'worker-2', lease=60)
+    assert db.get_pending_alerts() == []
+
+    db.release_alert('0xswap')
+    assert db.get_pending_alerts() == ['0xswap']
+    assert db.claim_alert('0xswap', 'worker-2', lease=60)
+    db.remove_alert('0xswap')
+    assert not db.claim_alert('0xswap', 'worker-1', lease=60)
+    assert db.get_pending_alerts() == []
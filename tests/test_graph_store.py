@@ -0,0 +1,71 @@
+from graph_store import GraphStore
+import pytest
+
+A, B, C, D = ('0x' + digit * 40 for digit in 'abcd')
+
+
+def tx(number, sender, receiver, block):
+    return {'hash': '0x' + f'{number:064x}', 'from': sender, 'to': receiver, 'blockNumber': str(block)}
+
+
+def test_append_compact_reopen_truncated_complete(tmp_path):
+    path = tmp_path / 'graph'
+    store = GraphStore(path)
+    store.add_transactions(A, [tx(1, A, B, 10), tx(2, C, A, 12)])
+    assert store.neighbors(A) == ([(B, tx(1, A, B, 10)['hash']), (A, tx(1, A, B, 10)['hash']),
+                                   (A, tx(2, C, A, 12)['hash']), (C, tx(2, C, A, 12)['hash'])], 2)
+    assert store.sync_state(A) == (12, False)
+    assert store.neighbors(B) is None and store.has(B) is False
+
+    store.compact()
+    store.add_transactions(A, [tx(3, A, D, 15)])
+    expected = store.neighbors(A)
+    assert expected[1] == 3 and expected[0][-2:] == [(D, tx(3, A, D, 15)['hash']), (A, tx(3, A, D, 15)['hash'])]
+
+    # Edges appended after the compaction are read back from the log
+    store.close()
+    store = GraphStore(path)
+    assert store.neighbors(A) == expected
+    assert store.sync_state(A) == (15, False)
+    store.compact()
+    assert GraphStore(path).neighbors(A) == expected
+
+    # A partly downloaded history keeps its size only
+    store.add_transactions(B, [tx(1, A, B, 10), tx(4, B, C, 20)], complete=False)
+    assert store.neighbors(B) == ([], 2)
+    assert store.sync_state(B) == (0, True)
+    store = GraphStore(path)
+    assert store.neighbors(B) == ([], 2)
+    assert store.sync_state(B) == (0, True)
+
+    # The complete history replaces it
+    store.add_transactions(B, [tx(1, A, B, 10), tx(4, B, C, 20), tx(5, D, B, 21)])
+    assert store.sync_state(B) == (21, False)
+    assert store.neighbors(B)[1] == 3
+    assert [neighbor for neighbor, _ in store.neighbors(B)[0]] == [B, A, C, B, B, D]
+    store.compact()
+    store = GraphStore(path)
+    assert store.sync_state(B) == (21, False)
+    assert store.neighbors(B)[1] == 3
+    assert store.neighbors(A) == expected
+
+    # A truncated download never overwrites a complete history
+    store.add_transactions(B, [tx(6, B, C, 30)], complete=False)
+    assert store.sync_state(B) == (21, False)
+    assert store.stats()['fetched'] == 2
+
+
+def test_rebuild_matches_incremental(tmp_path):
+    histories = [(A, [tx(1, A, B, 10), tx(2, C, A, 12)]), (C, [tx(2, C, A, 12)])]
+    incremental = GraphStore(tmp_path / 'incremental')
+    for address, transactions in histories:
+        incremental.add_transactions(address, transactions)
+    rebuilt = GraphStore.rebuild(tmp_path / 'rebuilt', histories)
+    for address in (A, C):
+        assert rebuilt.neighbors(address) == incremental.neighbors(address)
+
+
+def test_old_format_is_rejected(tmp_path):
+    (tmp_path / 'nodes.bin').write_bytes(b'\0' * 8)
+    with pytest.raises(ValueError):
+        GraphStore(tmp_path)
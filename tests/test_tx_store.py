@@ -0,0 +1,76 @@
+from tx_store import TransactionStore
+import tx_store
+import pytest
+
+ADDRESS = '0x' + 'a' * 40
+PAGE = 4
+
+
+class FakeClient:
+    """Answers `txlist`/`tokentx` queries from a fixed history, at most `PAGE` rows per query like Etherscan."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def get_result(self, startblock=0, endblock=99999999, sort='asc', offset=None, **params):
+        self.calls.append((startblock, endblock, sort))
+        rows = [row for row in self.rows if startblock <= int(row['blockNumber']) <= endblock]
+        if sort == 'desc':
+            rows = sorted(rows, key=lambda row: -int(row['blockNumber']))
+        return rows[:min(offset or PAGE, PAGE)]
+
+
+def transfer(block, tx_hash, value='1'):
+    return {'blockNumber': str(block), 'timeStamp': str(block * 100), 'hash': tx_hash, 'from': ADDRESS,
+            'to': '0x' + 'b' * 40, 'contractAddress': '0x' + 'c' * 40, 'value': value}
+
+
+@pytest.fixture(autouse=True)
+def small_pages(monkeypatch):
+    monkeypatch.setattr(tx_store, 'ETHERSCAN_MAX_RESULTS', PAGE)
+
+
+def test_row_keys_number_repeats():
+    row = transfer(3, '0x03')
+    keys = TransactionStore._row_keys([row, dict(row), transfer(3, '0x03', '2'), dict(row)])
+    base = TransactionStore._row_key(row)
+    assert keys == [base, f'{base}|#1', TransactionStore._row_key(transfer(3, '0x03', '2')), f'{base}|#2']
+
+
+def test_resumed_sync_keeps_equal_transfers(tmp_path):
+    # The first page ends between two equal transfers of one transaction
+    rows = [transfer(1, '0x01'), transfer(2, '0x02'), transfer(2, '0x22'), transfer(3, '0x03'),
+            transfer(3, '0x03'), transfer(3, '0x33'), transfer(4, '0x04')]
+    client = FakeClient(list(rows))
+    store = TransactionStore(client, str(tmp_path / 'transactions.db'))
+
+    assert store.sync(ADDRESS, 'tokentx') == 9
+    assert [call[0] for call in client.calls] == [0, 3, 4]
+    assert store.get_transactions(ADDRESS, 'tokentx', sort='asc', refresh=False) == rows
+
+    # Later syncs only fetch blocks above the watermark, and refetching a block adds nothing
+    client.rows.append(transfer(5, '0x05'))
+    assert store.sync(ADDRESS, 'tokentx') == 1
+    store.merge(ADDRESS, rows, 'tokentx')
+    assert store.get_transactions(ADDRESS, 'tokentx', sort='asc', refresh=False) == client.rows
+    assert store.get_watermark(ADDRESS, 'tokentx') == 5
+
+
+def test_recent_window_seed_and_backfill(tmp_path):
+    rows = [transfer(block, f'0x{block:02x}') for block in range(1, 11)]
+    rows.insert(7, transfer(7, '0x77'))
+    client = FakeClient(rows)
+    store = TransactionStore(client, str(tmp_path / 'transactions.db'))
+
+    # Block 7 is where the newest-first query stopped, so only blocks 8 to 10 are stored
+    recent = store.get_transactions(ADDRESS, sort='asc', start_time=750)
+    assert [row['blockNumber'] for row in recent] == ['8', '9', '10']
+    assert store.get_sync_state(ADDRESS) == (10, 8, 701)
+    assert not store.is_complete(ADDRESS)
+    assert store.get_addresses() == []
+
+    # A query reaching further back completes the history
+    assert store.get_transactions(ADDRESS, sort='asc', start_time=0) == rows
+    assert store.is_complete(ADDRESS)
+    assert store.get_addresses() == [ADDRESS]
@@ -0,0 +1,75 @@
+import benchmark
+import pytest
+import os
+
+
+@pytest.fixture(scope='module')
+def bench():
+    cwd = os.getcwd()
+    bench = benchmark.Bench(scale=0.1, seed=0)
+    bench.reset()
+    yield bench
+    bench.close()
+    os.chdir(cwd)
+
+
+def baseline_find_hops(histories, start_address, target_addresses, max_hops=2, max_transactions=100):
+    """The original breadth-first search, reading every address's whole history."""
+    visited = set()
+    queue = [(start_address.lower(), [], None, 0)]
+    enqueued = {start_address.lower()}
+    paths = []
+    while queue:
+        address, path, prev_tx_hash, hops = queue.pop(0)
+        path = path + [(address, prev_tx_hash)]
+        transactions = histories.get(address, [])
+        for transaction in transactions:
+            tx_hash = transaction['hash']
+            for new_address in (transaction['to'].lower(), transaction['from'].lower()):
+                if new_address and new_address not in visited and new_address not in enqueued:
+                    if new_address in target_addresses:
+                        paths.append((path + [(new_address, tx_hash)], hops + 1))
+                    elif hops < max_hops and len(transactions) <= max_transactions:
+                        queue.append((new_address, path, tx_hash, hops + 1))
+                        enqueued.add(new_address)
+                    visited.add(new_address)
+    return paths
+
+
+def found(paths):
+    return {path[-1][0]: hops for path, hops in paths}
+
+
+def assert_valid(histories, start, paths):
+    for path, hops in paths:
+        assert path[0] == (start, None) and len(path) == hops + 1
+        for (address, _), (neighbor, tx_hash) in zip(path, path[1:]):
+            assert any(tx['hash'] == tx_hash and neighbor in (tx['from'], tx['to']) for tx in histories[address])
+
+
+@pytest.mark.parametrize('max_hops', [1, 2])
+def test_find_hops_matches_baseline(bench, tmp_path, max_hops):
+    import wallet_link
+    starts, targets = benchmark.link_endpoints(bench)
+    histories = bench.chain.histories
+    hubs = wallet_link.HubRegistry(str(tmp_path / 'hubs.json'))
+    for cache_kind in ('cold', 'hubs'):
+        for start in starts:
+            expected = found(baseline_find_hops(histories, start, targets, max_hops))
+            cache = wallet_link.NeighborCache(max_transactions=100, hubs=hubs if cache_kind == 'hubs' else None)
+            paths = wallet_link.find_hops(start, targets, max_hops=max_hops, cache=cache)
+            assert_valid(histories, start, paths)
+            # Targets next to a hub are found from their own history, so more may be found, never fewer
+            got = found(paths)
+            assert {target: got.get(target) for target in expected} == expected
+
+
+@pytest.mark.parametrize('max_hops', [1, 2, 3])
+def test_bidirectional_matches_find_hops(bench, max_hops):
+    import wallet_link
+    starts, targets = benchmark.link_endpoints(bench)
+    for start in starts:
+        cache = wallet_link.NeighborCache(max_transactions=100)
+        paths = wallet_link.find_hops_bidirectional(start, targets, max_hops=max_hops, cache=cache)
+        assert_valid(bench.chain.histories, start, paths)
+        assert found(paths) == found(wallet_link.find_hops(start, targets, max_hops=max_hops, cache=cache))
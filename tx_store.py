@@ -0,0 +1,272 @@
+from etherscan_client import EtherscanClient
+from metrics import metrics
+from typing import Dict, List, Optional, Tuple
+from collections import Counter
+from threading import Lock
+import sqlite3
+import json
+import time
+
+DEFAULT_DB_PATH = "transactions.db"
+ETHERSCAN_MAX_RESULTS = 10000
+FIRST_SEEN_PAGE = 50
+JUST_SYNCED_TTL = 60
+KEY_FIELDS = ('hash', 'logIndex', 'from', 'to', 'contractAddress', 'value')
+
+
+class TransactionStore:
+    """Local SQLite copy of each address's Etherscan history, synced incrementally from a block watermark.
+
+    Rows are kept exactly as Etherscan returned them, so callers keep the usual list-of-dicts interface.
+    Volatile fields such as `confirmations` reflect the time a row was first fetched.
+
+    An address first queried from a recent time on is only downloaded back to that time (see `_seed`). Its
+    watermark then records the first block and timestamp from which the stored history is complete, and the
+    older blocks are fetched the first time a query reaches before them.
+    """
+
+    def __init__(self, client: EtherscanClient, db_path: str = DEFAULT_DB_PATH):
+        self.client = client
+        self.lock = Lock()
+        self.just_synced: Dict[str, float] = {}
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS transactions
+                                 (address text, action text, key text, block_number integer, time_stamp integer,
+                                  data text, PRIMARY KEY (address, action, key))''')
+            self.conn.execute('''CREATE INDEX IF NOT EXISTS transactions_block
+                                 ON transactions (address, action, block_number)''')
+            self.conn.execute('''CREATE INDEX IF NOT EXISTS transactions_time
+                                 ON transactions (address, action, time_stamp)''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS watermarks
+                                 (address text, action text, block integer, first_block integer NOT NULL DEFAULT 0,
+                                  first_time integer NOT NULL DEFAULT 0, PRIMARY KEY (address, action))''')
+            # Stores created before histories could start at a recent block only hold complete ones
+            columns = {row[1] for row in self.conn.execute('PRAGMA table_info(watermarks)')}
+            for column in ('first_block', 'first_time'):
+                if column not in columns:
+                    self.conn.execute(f'ALTER TABLE watermarks ADD COLUMN {column} integer NOT NULL DEFAULT 0')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS first_seen
+                                 (address text PRIMARY KEY, block integer, time_stamp integer)''')
+
+    @staticmethod
+    def _row_key(tx: dict) -> str:
+        return '|'.join(str(tx.get(field, '')).lower() for field in KEY_FIELDS)
+
+    @classmethod
+    def _row_keys(cls, transactions: List[dict]) -> List[str]:
+        """Key of each row of one response.
+
+        `tokentx` rows have no log index, so two equal transfers in one transaction share a key; repeats are
+        numbered in response order. A transaction's rows always come back together and in the same order,
+        so fetching its block again yields the same keys and the rows already stored are ignored.
+        """
+        seen = Counter()
+        keys = []
+        for tx in transactions:
+            key = cls._row_key(tx)
+            keys.append(f'{key}|#{seen[key]}' if seen[key] else key)
+            seen[key] += 1
+        return keys
+
+    def get_watermark(self, address: str, action: str = 'txlist') -> Optional[int]:
+        state = self.get_sync_state(address, action)
+        return state[0] if state else None
+
+    def get_sync_state(self, address: str, action: str = 'txlist') -> Optional[Tuple[int, int, int]]:
+        """Watermark of the address, and the block and timestamp from which its stored history is complete."""
+        with self.lock:
+            row = self.conn.execute('''SELECT block, first_block, first_time FROM watermarks
+                                       WHERE address=? AND action=?''', (address.lower(), action)).fetchone()
+        return tuple(row) if row else None
+
+    def is_complete(self, address: str, action: str = 'txlist') -> bool:
+        """Whether the address's whole history, back to block 0, is stored."""
+        state = self.get_sync_state(address, action)
+        return state is not None and state[1] == 0
+
+    def _insert(self, address: str, action: str, transactions: List[dict],
+                first_block: int = 0, first_time: int = 0) -> None:
+        """Store rows and raise the watermark; `first_block` and `first_time` only apply to a new address."""
+        rows = [(address, action, key, int(tx['blockNumber']), int(tx['timeStamp']), json.dumps(tx))
+                for key, tx in zip(self._row_keys(transactions), transactions)]
+        highest = max(row[3] for row in rows)
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.conn.execute('''INSERT INTO watermarks VALUES (?, ?, ?, ?, ?)
+                                 ON CONFLICT (address, action) DO UPDATE SET block=MAX(block, excluded.block)''',
+                              (address, action, highest, first_block, first_time))
+
+    def merge(self, address: str, transactions: List[dict], action: str = 'txlist') -> None:
+        """Store an address's complete history fetched elsewhere (oldest first), e.g. page by page."""
+        if transactions:
+            self._insert(address.lower(), action, transactions)
+            self._mark_complete(address.lower(), action)
+
+    def _mark_complete(self, address: str, action: str) -> None:
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE watermarks SET first_block=0, first_time=0 WHERE address=? AND action=?',
+                              (address, action))
+
+    def sync(self, address: str, action: str = 'txlist', start_block: Optional[int] = None,
+             start_time: Optional[int] = None) -> int:
+        """Fetch the transactions above the address's watermark and merge them in. Returns the number fetched.
+
+        `start_block` and `start_time` bound the rows the caller needs. A new address needed from `start_time`
+        on is seeded from its newest transactions. A history stored from a recent block on is completed back to
+        block 0 once a query reaches before that block.
+        """
+        address = address.lower()
+        state = self.get_sync_state(address, action)
+        if state is None:
+            if start_time is not None:
+                return self._seed(address, action, start_time)
+            return self._fetch(address, action, 0)
+
+        watermark, first_block, first_time = state
+        fetched = 0
+        if first_block > 0 and not ((start_block is not None and start_block >= first_block) or
+                                    (start_time is not None and start_time >= first_time)):
+            fetched += self._fetch(address, action, 0, first_block - 1)
+            self._mark_complete(address, action)
+        return fetched + self._fetch(address, action, watermark + 1)
+
+    def _seed(self, address: str, action: str, start_time: int) -> int:
+        """First sync of an address needed from `start_time` on, reading its transactions newest first.
+
+        Queries go back block range by block range until they pass `start_time`. A history that ends before
+        that is stored whole. Otherwise the oldest block reached, which a query may have cut off, is left out,
+        and the history is stored as complete from the next block on.
+        """
+        transactions = []
+        end_block = 99999999
+        complete = True
+        while True:
+            batch = self.client.get_result(module='account', action=action, address=address, startblock=0,
+                                           endblock=end_block, page=1, offset=ETHERSCAN_MAX_RESULTS, sort='desc')
+            if not isinstance(batch, list) or not batch:
+                break
+            # The block the previous query ended in comes back whole
+            while transactions and int(transactions[-1]['blockNumber']) == end_block:
+                transactions.pop()
+            transactions.extend(batch)
+            if len(batch) < ETHERSCAN_MAX_RESULTS:
+                break
+            oldest_block, oldest_time = int(batch[-1]['blockNumber']), int(batch[-1]['timeStamp'])
+            if oldest_time < start_time or oldest_block == end_block:
+                complete = False
+                break
+            end_block = oldest_block
+
+        first_block = first_time = 0
+        if not complete:
+            transactions = [tx for tx in transactions if int(tx['blockNumber']) > oldest_block]
+            first_block, first_time = oldest_block + 1, oldest_time + 1
+        if transactions:
+            self._insert(address, action, transactions[::-1], first_block, first_time)
+        return len(transactions)
+
+    def _fetch(self, address: str, action: str, start_block: int, end_block: int = 99999999) -> int:
+        """Fetch and store the transactions of a block range, oldest first. Returns the number fetched."""
+        fetched = 0
+        while True:
+            transactions = self.client.get_result(module='account', action=action, address=address,
+                                                  startblock=start_block, endblock=end_block, sort='asc')
+            if not isinstance(transactions, list) or not transactions:
+                break
+            self._insert(address, action, transactions)
+            fetched += len(transactions)
+            if len(transactions) < ETHERSCAN_MAX_RESULTS:
+                break
+            # Etherscan caps a query at 10,000 rows: resume from the last block, duplicates are ignored
+            last_block = int(transactions[-1]['blockNumber'])
+            if last_block == start_block:
+                break
+            start_block = last_block
+        return fetched
+
+    def first_seen(self, address: str) -> Optional[Tuple[int, int]]:
+        """Block and timestamp of the address's earliest transaction, or None if it has none yet.
+
+        The answer never changes once found, so it is looked up only once: from the stored history when it
+        has been synced, otherwise with a small `sort=asc` page. A page that is not full is the address's
+        whole history, which is stored and counts as synced for a `get_transactions` within the next minute.
+        """
+        address = address.lower()
+        synced = self.is_complete(address)
+        with self.lock:
+            row = self.conn.execute('SELECT block, time_stamp FROM first_seen WHERE address=?', (address,)).fetchone()
+            if row is None and synced:
+                row = self.conn.execute('''SELECT block_number, time_stamp FROM transactions
+                                           WHERE address=? AND action='txlist'
+                                           ORDER BY block_number, rowid LIMIT 1''', (address,)).fetchone()
+        metrics.cache('first_seen', row is not None)
+        if row is None:
+            transactions = self.client.get_result(module='account', action='txlist', address=address, startblock=0,
+                                                  endblock=99999999, page=1, offset=FIRST_SEEN_PAGE, sort='asc')
+            if not isinstance(transactions, list) or not transactions:
+                return None
+            row = (int(transactions[0]['blockNumber']), int(transactions[0]['timeStamp']))
+            if len(transactions) < FIRST_SEEN_PAGE and not synced:
+                self._insert(address, 'txlist', transactions)
+                now = time.monotonic()
+                with self.lock:
+                    # Entries that were never followed by a `get_transactions` are dropped once they expire.
+                    self.just_synced = {key: synced_at for key, synced_at in self.just_synced.items()
+                                        if now - synced_at < JUST_SYNCED_TTL}
+                    self.just_synced[address] = now
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO first_seen VALUES (?, ?, ?)', (address, row[0], row[1]))
+        return tuple(row)
+
+    def get_addresses(self, action: str = 'txlist') -> List[str]:
+        """Addresses whose whole history for `action` has been synced."""
+        with self.lock:
+            rows = self.conn.execute('''SELECT address FROM watermarks WHERE action=? AND first_block=0
+                                        ORDER BY address''', (action,)).fetchall()
+        return [row[0] for row in rows]
+
+    def get_transactions(self, address: str, action: str = 'txlist', sort: str = 'desc',
+                         start_block: Optional[int] = None, end_block: Optional[int] = None,
+                         start_time: Optional[int] = None, end_time: Optional[int] = None,
+                         refresh: bool = True) -> List[dict]:
+        """Return the address's transactions, optionally bounded by block number and/or unix timestamp (inclusive).
+
+        With `refresh` the store is first synced from Etherscan, fetching only blocks above the watermark, and
+        the older blocks the query needs if the address's history was stored from a recent block on.
+        """
+        address = address.lower()
+        with self.lock:
+            synced_at = self.just_synced.pop(address, None) if action == 'txlist' else None
+        skip_sync = synced_at is not None and time.monotonic() - synced_at < JUST_SYNCED_TTL
+        if refresh and not skip_sync:
+            metrics.cache('tx_store', self.sync(address, action, start_block, start_time) == 0)
+
+        query = 'SELECT data FROM transactions WHERE address=? AND action=?'
+        params = [address, action]
+        for column, operator, value in (('block_number', '>=', start_block), ('block_number', '<=', end_block),
+                                        ('time_stamp', '>=', start_time), ('time_stamp', '<=', end_time)):
+            if value is not None:
+                query += f' AND {column} {operator} ?'
+                params.append(int(value))
+        direction = 'DESC' if sort == 'desc' else 'ASC'
+        query += f' ORDER BY block_number {direction}, rowid {direction}'
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+_stores: Dict[str, TransactionStore] = {}
+_stores_lock = Lock()
+
+
+def get_store(client: EtherscanClient, db_path: str = DEFAULT_DB_PATH) -> TransactionStore:
+    """Return the process-wide store for a database file, creating it on first use."""
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = TransactionStore(client, db_path)
+        return _stores[db_path]
@@ -1,4 +1,10 @@
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from etherscan_client import get_client
+from graph_store import GraphStore
+from tx_store import get_store
+from pathlib import Path
+import argparse
+import json
 import yaml
 
 
@@ -8,40 +14,401 @@ config = yaml.load(file, Loader=yaml.FullLoader)
 
 # Get Twitter Credentials
 ETHERSCAN_API_KEY = config['Etherscan']["API_KEY"]
-API_URL = "https://api.etherscan.io/api?module=account&action=txlist&address={}&startblock=0&endblock=99999999&sort=asc&apikey={}"
 
 
-def get_transactions(address):
-    url = API_URL.format(address, ETHERSCAN_API_KEY)
-    response = requests.get(url)
-    data = response.json()
-    return data['result'] if 'result' in data else []
+MAX_PAGE_SIZE = 1000
+DEFAULT_WORKERS = 5
+KNOWN_HUBS = {
+    '0x7a250d5630b4cf539739df2c5dacb4c659f2488d': 'Uniswap V2 Router',
+    '0xe592427a0aece92de3edee1f18e0157c05861564': 'Uniswap V3 Router',
+    '0x3fc91a3afd70395cd496c647d5a6cc9d4b2b7fad': 'Uniswap Universal Router',
+    '0xef1c6e67703c7bd7107eed8303fbe6ec2554bf6b': 'Uniswap Universal Router (old)',
+    '0x1111111254eeb25477b68fb85ed929f73a960582': '1inch Router v5',
+    '0xdef1c0ded9bec7f1a1670819833240f027b25eff': '0x Exchange Proxy',
+    '0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2': 'WETH',
+    '0x28c6c06298d514db089934071355e5743bf21d60': 'Binance 14',
+    '0x4e5b2e1dc63f6b91cb6cd759936495434c7e972f': 'FixedFloat',
+    '0x4dbd4fc535ac27206064b68ffcf827b0a60bab3f': 'Arbitrum Delayed Inbox',
+    '0x99c9fc46f92e8a1c0dec1b1747d010903e884be1': 'Optimism Gateway',
+}
 
 
-def find_hops(start_address, target_addresses, max_hops=2, max_transactions=100):
-    visited = set()
-    queue = [(start_address.lower(), [], None, 0)]
-    enqueued = set([start_address.lower()])
-    paths = []
-    while queue:
-        address, path, prev_tx_hash, hops = queue.pop(0)
-        path = path + [(address, prev_tx_hash)]
-        transactions = get_transactions(address)
+def get_transactions(address, max_transactions=None):
+    """Transactions of an address, oldest first.
+
+    With `max_transactions`, an address that is not cached yet is fetched page by page and the download
+    stops as soon as more than `max_transactions` rows were seen; the truncated list is returned as is.
+    Complete histories are saved to the transaction store.
+    """
+    store = get_store(get_client(ETHERSCAN_API_KEY))
+    if max_transactions is None or store.is_complete(address):
+        return store.get_transactions(address, sort='asc')
+
+    page_size = min(max_transactions + 1, MAX_PAGE_SIZE)
+    transactions = []
+    page = 1
+    while len(transactions) <= max_transactions:
+        batch = get_client(ETHERSCAN_API_KEY).get_result(module='account', action='txlist', address=address,
+                                                         startblock=0, endblock=99999999, page=page,
+                                                         offset=page_size, sort='asc')
+        if not isinstance(batch, list):
+            break
+        transactions.extend(batch)
+        if len(batch) < page_size:
+            store.merge(address, transactions)
+            break
+        page += 1
+    return transactions
+
+
+def get_transactions_since(address, start_block, refresh=False):
+    """Transactions of an address from `start_block` on, oldest first, as far as the transaction store knows.
+
+    With `refresh` the store is first synced from Etherscan, fetching only blocks above its watermark.
+    """
+    store = get_store(get_client(ETHERSCAN_API_KEY))
+    return store.get_transactions(address, sort='asc', start_block=start_block, refresh=refresh)
+
+
+class HubRegistry:
+    """Persistent set of hub addresses (exchanges, routers, bridges) that searches never expand.
+
+    It starts from `KNOWN_HUBS` and learns every address found with more transactions than allowed.
+    """
+
+    def __init__(self, path="hubs.json"):
+        self.path = Path(path)
+        self.hubs = dict(KNOWN_HUBS)
+        if self.path.exists():
+            self.hubs.update(json.loads(self.path.read_text()))
+
+    def __contains__(self, address):
+        return address in self.hubs
+
+    def learn(self, address, transaction_count):
+        if address not in self.hubs:
+            self.hubs[address] = f'learned: more than {transaction_count - 1} transactions'
+            learned = {address: label for address, label in self.hubs.items() if address not in KNOWN_HUBS}
+            self.path.write_text(json.dumps(learned, indent=2))
+
+
+class NeighborCache:
+    """Adjacency of each address, fetched at most once per run and shared by every search using it.
+
+    An address maps to its `(neighbor, tx_hash)` edges, in transaction order, and its transaction count.
+    With a `GraphStore`, addresses already in the store are read from disk and new ones are appended to it;
+    a stored address first gets the transactions the transaction store has above the graph's last block,
+    after syncing it from Etherscan with `refresh`.
+    With `max_transactions`, downloads stop past that many transactions: such an address is a hub, its
+    edges are only a prefix of its history and it is listed in `truncated`. Together with a `HubRegistry`
+    hubs are remembered across runs and never downloaded again.
+    """
+
+    def __init__(self, fetch=get_transactions, graph=None, max_transactions=None, hubs=None, refresh=False,
+                 fetch_since=get_transactions_since):
+        self.fetch = fetch
+        self.fetch_since = fetch_since
+        self.refresh = refresh
+        self.graph = graph
+        self.max_transactions = max_transactions
+        self.hubs = hubs
+        self.adjacency = {}
+        self.truncated = set()
+        self.links = {}
+
+    def is_hub(self, address):
+        return self.hubs is not None and address in self.hubs
+
+    def _load_stored(self, address):
+        stored = self.graph.neighbors(address) if self.graph is not None else None
+        if stored is None:
+            return False
+        block, truncated = self.graph.sync_state(address)
+        if truncated:
+            if self.max_transactions is None or stored[1] <= self.max_transactions:
+                # Too few transactions were stored to tell whether it is a hub under this limit
+                return False
+            self.truncated.add(address)
+        else:
+            newer = self.fetch_since(address, block + 1, self.refresh)
+            if newer:
+                self.graph.add_transactions(address, newer)
+                stored = self.graph.neighbors(address)
+        self.adjacency[address] = stored
+        return True
+
+    def _fetch(self, address):
+        if self.max_transactions is None:
+            return self.fetch(address)
+        return self.fetch(address, self.max_transactions)
+
+    def _add(self, address, transactions, complete=True):
+        edges = []
         for transaction in transactions:
-            new_addresses = [transaction['to'].lower(), transaction['from'].lower()]
-            tx_hash = transaction['hash']
-            for new_address in new_addresses:
-                if new_address and new_address not in visited and new_address not in enqueued:
-                    if new_address in target_addresses.keys():
-                        paths.append((path + [(new_address, tx_hash)], hops + 1))
-                    elif hops < max_hops and len(transactions) <= max_transactions:
-                        queue.append((new_address.lower(), path, tx_hash, hops + 1))
-                        enqueued.add(new_address)
-                    visited.add(new_address)
+            edges.append((transaction['to'].lower(), transaction['hash']))
+            edges.append((transaction['from'].lower(), transaction['hash']))
+        self.adjacency[address] = (edges, len(transactions))
+        if complete:
+            self.truncated.discard(address)
+        else:
+            self.truncated.add(address)
+        if self.graph is not None:
+            self.graph.add_transactions(address, transactions, complete)
+        if self.hubs is not None and self.max_transactions is not None \
+                and len(transactions) > self.max_transactions:
+            self.hubs.learn(address, len(transactions))
+
+    def _add_fetched(self, address, transactions):
+        # A bounded download that went past the limit may have stopped before the end of the history
+        self._add(address, transactions, self.max_transactions is None or len(transactions) <= self.max_transactions)
+
+    def get(self, address):
+        """Edges and transaction count of an address; the edges of a hub may be truncated."""
+        if address not in self.adjacency and not self._load_stored(address):
+            self._add_fetched(address, self._fetch(address))
+        return self.adjacency[address]
+
+    def get_complete(self, address):
+        """Edges and transaction count of an address from its whole history, whatever its size."""
+        if address in self.truncated or (address not in self.adjacency and not self._load_stored(address)):
+            self._add(address, self.fetch(address))
+        return self.adjacency[address]
+
+    def link(self, address, target):
+        """Hash of the first transaction between `address` and `target`, or None.
+
+        It is looked up in the target's complete history, so hubs are checked without downloading theirs.
+        """
+        if target not in self.links:
+            first = {}
+            for neighbor, tx_hash in self.get_complete(target)[0]:
+                first.setdefault(neighbor, tx_hash)
+            self.links[target] = first
+        return self.links[target].get(address)
+
+    def prefetch(self, addresses, max_workers=DEFAULT_WORKERS):
+        """Fetch every address not cached yet concurrently, so that the following `get` calls are free.
+
+        Only the downloads run in the worker threads; the shared Etherscan client rate-limits them, so
+        `max_workers` just bounds how many requests are in flight. The cache itself is updated here.
+        """
+        missing = [address for address in dict.fromkeys(addresses)
+                   if address not in self.adjacency and not self._load_stored(address)]
+        if max_workers <= 1 or len(missing) <= 1:
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for address, transactions in zip(missing, executor.map(self._fetch, missing)):
+                self._add_fetched(address, transactions)
+
+
+def rebuild_graph(path, refresh=False):
+    """Rebuild the graph store at `path` from every address history cached in the transaction store.
+
+    With `refresh` each history is first synced from Etherscan.
+    """
+    store = get_store(get_client(ETHERSCAN_API_KEY))
+    histories = ((address, store.get_transactions(address, sort='asc', refresh=refresh))
+                 for address in store.get_addresses())
+    return GraphStore.rebuild(path, histories)
+
+
+def find_links(start_addresses, target_addresses, max_hops=2, max_transactions=100, cache=None,
+               max_workers=DEFAULT_WORKERS):
+    """Breadth-first search from all start addresses at once, sharing one neighbor cache.
+
+    Every start keeps its own visited set, so the result for each start is what `find_hops` would return
+    for it alone: a list of `(path, hops)` with one shortest path per target reached.
+    Hubs, addresses with more than `max_transactions` transactions or in the cache's `HubRegistry`, are
+    reached like any other address but never expanded. A target linked to a hub is found from the
+    target's own history, so the result does not depend on how much of the hub's history was downloaded;
+    unlike other addresses, a hub does not mark its remaining neighbors as seen.
+    The search goes one hop level at a time: the whole level is fetched with up to `max_workers`
+    concurrent requests, then expanded in queue order, so the time spent waiting on Etherscan grows
+    with the number of levels rather than the number of addresses.
+    """
+    cache = cache if cache is not None else NeighborCache(max_transactions=max_transactions)
+    start_addresses = [address.lower() for address in start_addresses]
+    level = [(start, start, [], None, 0) for start in start_addresses]
+    visited = {start: {start} for start in start_addresses}
+    paths = {start: [] for start in start_addresses}
+    while level:
+        cache.prefetch([item[1] for item in level if not cache.is_hub(item[1])], max_workers)
+        next_level = []
+        for source, address, path, prev_tx_hash, hops in level:
+            path = path + [(address, prev_tx_hash)]
+            source_visited = visited[source]
+            if cache.is_hub(address) or cache.get(address)[1] > max_transactions:
+                for target in target_addresses:
+                    if target not in source_visited:
+                        tx_hash = cache.link(address, target)
+                        if tx_hash:
+                            paths[source].append((path + [(target, tx_hash)], hops + 1))
+                            source_visited.add(target)
+                continue
+            for new_address, tx_hash in cache.get(address)[0]:
+                if new_address and new_address not in source_visited:
+                    if new_address in target_addresses:
+                        paths[source].append((path + [(new_address, tx_hash)], hops + 1))
+                    elif hops < max_hops:
+                        next_level.append((source, new_address, path, tx_hash, hops + 1))
+                    source_visited.add(new_address)
+        level = next_level
+    return paths
+
+
+def find_hops(start_address, target_addresses, max_hops=2, max_transactions=100, cache=None,
+              max_workers=DEFAULT_WORKERS):
+    return find_links([start_address], target_addresses, max_hops, max_transactions, cache,
+                      max_workers)[start_address.lower()]
+
+
+def _build_path(forward, backward, left, right, tx_hash):
+    """Join the forward chain ending at `left` and the backward chain starting at `right` through `tx_hash`."""
+    path = []
+    node = left
+    while node is not None:
+        prev, prev_tx_hash, _ = forward[node]
+        path.append((node, prev_tx_hash))
+        node = prev
+    path.reverse()
+    node = right
+    while node is not None:
+        path.append((node, tx_hash))
+        node, tx_hash, _ = backward[node]
+    return path
+
+
+def _meet_in_the_middle(start, target, max_length, max_transactions, cache, blocked, max_workers=DEFAULT_WORKERS):
+    """Shortest path of at most `max_length` hops between `start` and `target`, or None.
+
+    Expands a whole BFS level of the smaller frontier at a time, from the start forward and from the target
+    backward, and stops at the first level where the frontiers meet. Each level is prefetched with up to
+    `max_workers` concurrent requests before it is expanded. Like the forward search, no node on the path
+    but the last one before the target may be a hub, and a hub's link to the target is read from the
+    target's complete history.
+    Hubs next to the target are never expanded backward, so only the forward side can reach them. Once one
+    is seen, the backward side stops at depth 2 and the forward side goes on until it has reached every
+    address that could be such a hub, `max_length - 1` hops from the start.
+    """
+    forward = {start: (None, None, 0)}  # address -> (previous address, tx hash, depth)
+    backward = {target: (None, None, 0)}  # address -> (next address towards the target, tx hash, depth)
+    forward_frontier, backward_frontier = [start], [target]
+    forward_depth = backward_depth = 0
+    hub_before_target = False
+
+    def is_hub(address):
+        return cache.is_hub(address) or cache.get(address)[1] > max_transactions
+
+    def usable_backward(address):
+        # Nodes two or more hops before the target are expanded by their predecessor on the path
+        return backward[address][2] <= 1 or not is_hub(address)
+
+    while forward_frontier:
+        within_budget = forward_depth + backward_depth < max_length
+        if not within_budget and not (hub_before_target and forward_depth < max_length - 1):
+            break
+        meetings = []
+        if within_budget and backward_frontier and len(backward_frontier) < len(forward_frontier) \
+                and not (hub_before_target and backward_depth >= 2):
+            cache.prefetch([address for address in backward_frontier
+                            if address != target and not cache.is_hub(address)], max_workers)
+            next_frontier = []
+            for address in backward_frontier:
+                if address == target:
+                    edges = cache.get_complete(target)[0]
+                elif is_hub(address):
+                    # A hub is only usable as the last address before the target: nothing leads to it
+                    hub_before_target = hub_before_target or backward[address][2] == 1
+                    continue
+                else:
+                    edges = cache.get(address)[0]
+                for new_address, tx_hash in edges:
+                    if not new_address or new_address in blocked:
+                        continue
+                    if new_address in forward and (address == target or not is_hub(new_address)):
+                        length = forward[new_address][2] + 1 + backward_depth
+                        meetings.append((length, new_address, address, tx_hash))
+                    elif new_address not in backward and (address == target or not cache.is_hub(new_address)):
+                        backward[new_address] = (address, tx_hash, backward_depth + 1)
+                        next_frontier.append(new_address)
+                        hub_before_target = hub_before_target or (address == target and cache.is_hub(new_address))
+            backward_frontier = next_frontier
+            backward_depth += 1
+        else:
+            cache.prefetch([address for address in forward_frontier if not cache.is_hub(address)], max_workers)
+            next_frontier = []
+            for address in forward_frontier:
+                if is_hub(address):
+                    # Hubs are never expanded, they can only be followed by the target itself
+                    tx_hash = cache.link(address, target)
+                    if tx_hash:
+                        meetings.append((forward_depth + 1, address, target, tx_hash))
+                    continue
+                for new_address, tx_hash in cache.get(address)[0]:
+                    if not new_address or new_address in blocked:
+                        continue
+                    if new_address in backward:
+                        if usable_backward(new_address):
+                            length = forward_depth + 1 + backward[new_address][2]
+                            meetings.append((length, address, new_address, tx_hash))
+                    elif new_address not in forward:
+                        forward[new_address] = (address, tx_hash, forward_depth + 1)
+                        next_frontier.append(new_address)
+            forward_frontier = next_frontier
+            forward_depth += 1
+
+        meetings = [meeting for meeting in meetings if meeting[0] <= max_length]
+        if meetings:
+            _, left, right, tx_hash = min(meetings, key=lambda meeting: meeting[0])
+            return _build_path(forward, backward, left, right, tx_hash)
+    return None
+
+
+def find_hops_bidirectional(start_address, target_addresses, max_hops=2, max_transactions=100, cache=None,
+                            max_workers=DEFAULT_WORKERS):
+    """Links from `start_address` to the targets, found by searching from both ends towards each other.
+
+    Finds the same targets as `find_hops`, at the same number of hops, and paths never run through another
+    target; among equally short paths the one picked may differ. The number of fetched addresses grows
+    roughly with the square root of what the forward search needs for the same depth, except for a target
+    next to a hub: since only the forward side can reach such a hub, it then searches almost as deep as
+    `find_hops`.
+    """
+    cache = cache if cache is not None else NeighborCache(max_transactions=max_transactions)
+    start_address = start_address.lower()
+    paths = []
+    for target in target_addresses:
+        if target == start_address:
+            continue
+        blocked = set(target_addresses) - {target}
+        path = _meet_in_the_middle(start_address, target, max_hops + 1, max_transactions, cache, blocked,
+                                   max_workers)
+        if path:
+            paths.append((path, len(path) - 1))
+    paths.sort(key=lambda item: item[1])
     return paths
 
 
-def main():
+def print_paths(start_address, paths, start_addresses, target_addresses):
+    if paths:
+        for path, hops in paths:
+            print(
+                f'\n{start_addresses[path[0][0]]} ({path[0][0]}) linked to {target_addresses[path[-1][0]]} ({path[-1][0]}) after {hops} hops')
+            print('\nThe path is:')
+            for addr, tx_hash in path:
+                if addr in start_addresses:
+                    print(f'Address: {start_addresses[addr]} ({addr}) - Transaction Hash: {tx_hash}')
+                elif addr in target_addresses:
+                    print(f'Address: {target_addresses[addr]} ({addr}) - Transaction Hash: {tx_hash}')
+                else:
+                    print(f'Address: {addr} - Transaction Hash: {tx_hash}')
+            print()
+    else:
+        print(
+            f"No link found between {start_addresses[start_address]} ({start_address}) and the target_addresses within the specified max hop limit.")
+
+
+def main(max_hops=2, bidirectional=False, graph=None, max_workers=DEFAULT_WORKERS, refresh=False):
     start_addresses = {
         '0x18d044d8c82360c5834e220e8c1ad624fb7b9e03': 'PAI',
         '0xd7d82568bd2cdaa4d8a1049c535ab8e6827728c1': 'PAI',
@@ -97,68 +464,76 @@ def main():
 
     start_addresses = {address.lower(): name for address, name in start_addresses.items()}
 
-    for start_address, start_name in start_addresses.items():
-        target_addresses = {
-            # '0xc9E170d9C62b7765F624459C3fdDf23de9f4CeC3': 'TEST_1',
-            # '0xd6BDF425640032b949aeB2130a9ACB9a3181B58b': 'TEST_1',
-            # '0x50eD4D3e48B27681371b0c9F375Eb12a85e241Dc': "TEST_1",
-            # '0x58203347923ef9751748D098084611FF4473d1Cd': 'TEST_4',
-            # '0xbdb4BeeF21efC8AE04A6Bf11e685954BEc015125': 'TEST_5',
-            # '0x80C94d637F5F51758D5935284F3B3091ceEf2a8C': 'TEST_6',
-            # '0x7322f9932d68FB99a84fb9F89375c8cB7EBb9bB9': 'TEST_7',
-            # '0x32Fd0f2853dd29b479c4879D7683d81e5C3cC3c1': 'TEST_8',
-            # '0x4730d108aC076973373155932a465ed438C7b1a2': 'TEST_9',
-            # '0x82ea7840441c4B4E16Ce4A9c58364dc7FBe19048': 'TEST_10',
-            # '0x861193dF5007fDE8DC8F2B72dB746DFf226Cea68': 'TEST_11',
-            # '0x743CB013D459c358ed571A21cC105E35c284C385': 'TEST_12',
-            # '0x9822E23558c2837a499541Bf22433B0F820F213A': 'TEST_13',
-            # '0x5440cC69CB31CA46decf34C246FC395378D731b4': 'TEST_14',
-            # '0xC78d8F4493B5A1455152DE575deE50D986871eC9': 'TEST_15',
-            # '0xc863E595C3b56F142CF71682c74B25F719EE85E2': 'TEST_1',
-            # '0xF9c336825Ebb7C8fC2c96856912364d8a35E8145': 'TEST_1',
-            # '0x234a3bA2dd72d82853974aB185439761Ec391db7': 'TEST_1',
-            # '0xeDAf179d5436dE9eF5e0052F3E13De963976c5B2': 'TEST_1',
-            # '0x3641677dB54a774B8C2be96268aBf7a052E15985': 'TEST_1',
-            # '0xa9A6747E4B17122359684C8D6c491A0098d832F8': 'TEST_1',
-            # '0x11238CD54755895718d03880b6d28D04aB628263': 'TEST_1',
-            # '0xac617d90C4ce370fC7bCb216d66eA6f809830f82': 'TEST_1',
-            # '0x3EB109Be82C6C20f5dbbF91dbc19Dd22C4550AaF': 'TEST_1',
-            # '0x514854B5E7BF04Fd9996483bB028cb054bE19637': 'TEST_1',
-            # '0x69889BEA959641b8ef932C3C969810bEe21E5AfA': 'TEST_1',
-            # '0xA7CE0C0BDeC1ce84575daBECB38F362f171B6235': 'TEST_1',
-            # '0xa484F156526f2377Be2f93327640F45B6BDcB8f1': 'TEST_1',
-            # '0x50171E875BC1Af9Af749fE88057220675d107013': 'TEST_1',
-
-            '0x4ad434b8CDC3AA5AC97932D6BD18b5d313aB0f6f': 'EVERMOON',
-            '0x590f00eDc668D5af987c6076c7302C42B6FE9DD3': 'SCAM',
-            '0x370DE5fEeb723a92d8ef7d269620Ea3736268520': 'AUDITUS',
-            '0xE08eF9206a8a7C9337cC6611b4f5226Fdafc4772': 'MESSI',
-
-            '0x5D39957Fc88566F14AE7E8aB8971d7c603f0ce5e': 'EYE',
-            '0x3db045814D0a29d831fe38055CB97a956eF7cAfb': 'REMIT',
-            '0x85225Ed797fd4128Ac45A992C46eA4681a7A15dA': 'HYPE',
-            '0x3486b751a36F731A1bEbFf779374baD635864919': 'INEDIBLE',
-            '0xF68415bE72377611e95d59bc710CcbBbf94C4Fa2': 'AAI',
-        }
-        target_addresses = {address.lower(): name for address, name in target_addresses.items()}
-        paths = find_hops(start_address, target_addresses)
-        if paths:
-            for path, hops in paths:
-                print(
-                    f'\n{start_addresses[path[0][0]]} ({path[0][0]}) linked to {target_addresses[path[-1][0]]} ({path[-1][0]}) after {hops} hops')
-                print('\nThe path is:')
-                for addr, tx_hash in path:
-                    if addr in start_addresses:
-                        print(f'Address: {start_addresses[addr]} ({addr}) - Transaction Hash: {tx_hash}')
-                    elif addr in target_addresses:
-                        print(f'Address: {target_addresses[addr]} ({addr}) - Transaction Hash: {tx_hash}')
-                    else:
-                        print(f'Address: {addr} - Transaction Hash: {tx_hash}')
-                print()
-        else:
-            print(
-                f"No link found between {start_addresses[start_address]} ({start_address}) and the target_addresses within the specified max hop limit.")
+    target_addresses = {
+        # '0xc9E170d9C62b7765F624459C3fdDf23de9f4CeC3': 'TEST_1',
+        # '0xd6BDF425640032b949aeB2130a9ACB9a3181B58b': 'TEST_1',
+        # '0x50eD4D3e48B27681371b0c9F375Eb12a85e241Dc': "TEST_1",
+        # '0x58203347923ef9751748D098084611FF4473d1Cd': 'TEST_4',
+        # '0xbdb4BeeF21efC8AE04A6Bf11e685954BEc015125': 'TEST_5',
+        # '0x80C94d637F5F51758D5935284F3B3091ceEf2a8C': 'TEST_6',
+        # '0x7322f9932d68FB99a84fb9F89375c8cB7EBb9bB9': 'TEST_7',
+        # '0x32Fd0f2853dd29b479c4879D7683d81e5C3cC3c1': 'TEST_8',
+        # '0x4730d108aC076973373155932a465ed438C7b1a2': 'TEST_9',
+        # '0x82ea7840441c4B4E16Ce4A9c58364dc7FBe19048': 'TEST_10',
+        # '0x861193dF5007fDE8DC8F2B72dB746DFf226Cea68': 'TEST_11',
+        # '0x743CB013D459c358ed571A21cC105E35c284C385': 'TEST_12',
+        # '0x9822E23558c2837a499541Bf22433B0F820F213A': 'TEST_13',
+        # '0x5440cC69CB31CA46decf34C246FC395378D731b4': 'TEST_14',
+        # '0xC78d8F4493B5A1455152DE575deE50D986871eC9': 'TEST_15',
+        # '0xc863E595C3b56F142CF71682c74B25F719EE85E2': 'TEST_1',
+        # '0xF9c336825Ebb7C8fC2c96856912364d8a35E8145': 'TEST_1',
+        # '0x234a3bA2dd72d82853974aB185439761Ec391db7': 'TEST_1',
+        # '0xeDAf179d5436dE9eF5e0052F3E13De963976c5B2': 'TEST_1',
+        # '0x3641677dB54a774B8C2be96268aBf7a052E15985': 'TEST_1',
+        # '0xa9A6747E4B17122359684C8D6c491A0098d832F8': 'TEST_1',
+        # '0x11238CD54755895718d03880b6d28D04aB628263': 'TEST_1',
+        # '0xac617d90C4ce370fC7bCb216d66eA6f809830f82': 'TEST_1',
+        # '0x3EB109Be82C6C20f5dbbF91dbc19Dd22C4550AaF': 'TEST_1',
+        # '0x514854B5E7BF04Fd9996483bB028cb054bE19637': 'TEST_1',
+        # '0x69889BEA959641b8ef932C3C969810bEe21E5AfA': 'TEST_1',
+        # '0xA7CE0C0BDeC1ce84575daBECB38F362f171B6235': 'TEST_1',
+        # '0xa484F156526f2377Be2f93327640F45B6BDcB8f1': 'TEST_1',
+        # '0x50171E875BC1Af9Af749fE88057220675d107013': 'TEST_1',
+
+        '0x4ad434b8CDC3AA5AC97932D6BD18b5d313aB0f6f': 'EVERMOON',
+        '0x590f00eDc668D5af987c6076c7302C42B6FE9DD3': 'SCAM',
+        '0x370DE5fEeb723a92d8ef7d269620Ea3736268520': 'AUDITUS',
+        '0xE08eF9206a8a7C9337cC6611b4f5226Fdafc4772': 'MESSI',
+
+        '0x5D39957Fc88566F14AE7E8aB8971d7c603f0ce5e': 'EYE',
+        '0x3db045814D0a29d831fe38055CB97a956eF7cAfb': 'REMIT',
+        '0x85225Ed797fd4128Ac45A992C46eA4681a7A15dA': 'HYPE',
+        '0x3486b751a36F731A1bEbFf779374baD635864919': 'INEDIBLE',
+        '0xF68415bE72377611e95d59bc710CcbBbf94C4Fa2': 'AAI',
+    }
+    target_addresses = {address.lower(): name for address, name in target_addresses.items()}
+    cache = NeighborCache(graph=graph, max_transactions=100, hubs=HubRegistry(), refresh=refresh)
+    if bidirectional:
+        links = {start_address: find_hops_bidirectional(start_address, target_addresses, max_hops, cache=cache,
+                                                        max_workers=max_workers)
+                 for start_address in start_addresses}
+    else:
+        links = find_links(start_addresses, target_addresses, max_hops, cache=cache, max_workers=max_workers)
+    if graph is not None:
+        graph.compact()
+    for start_address in start_addresses:
+        print_paths(start_address, links[start_address], start_addresses, target_addresses)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Find transaction paths between start and target addresses")
+    parser.add_argument('--max-hops', type=int, default=2)
+    parser.add_argument('--bidirectional', action='store_true',
+                        help="search from the start and the targets at the same time (affordable for 3-4 hops)")
+    parser.add_argument('--graph', help="directory of a persistent graph store reused across runs")
+    parser.add_argument('--rebuild-graph', action='store_true',
+                        help="rebuild the --graph store from the cached transactions before searching")
+    parser.add_argument('--refresh-graph', action='store_true',
+                        help="sync the addresses read from the --graph store with Etherscan to pick up new activity")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="addresses of a hop level fetched concurrently (1 = one at a time)")
+    args = parser.parse_args()
+    graph = None
+    if args.graph:
+        graph = rebuild_graph(args.graph, args.refresh_graph) if args.rebuild_graph else GraphStore(args.graph)
+    main(args.max_hops, args.bidirectional, graph, args.workers, args.refresh_graph)
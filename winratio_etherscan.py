@@ -1,6 +1,11 @@
-import requests
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from etherscan_client import get_client
+from tx_store import get_store
+from pnl_ledger import PnLLedger, Trade
 from collections import defaultdict
+from decimal import Decimal
+import pandas as pd
+import argparse
 import yaml
 
 # Upload the config file
@@ -10,35 +15,117 @@ config = yaml.load(file, Loader=yaml.FullLoader)
 # Get Twitter Credentials
 ETHERSCAN_API_KEY = config['Etherscan']["API_KEY"]
 
+TRANSFER_COLUMNS = ['blockNumber', 'timeStamp', 'hash', 'from', 'to', 'value', 'contractAddress', 'tokenSymbol',
+                    'tokenDecimal']
+# Raw amounts (up to 78 digits) are summed exactly as base 10^12 int64 limbs, most significant first
+LIMB_DIGITS = 12
+LIMB_COUNT = 7
+LIMB_COLUMNS = [f'limb{i}' for i in range(LIMB_COUNT)]
+
 
 def get_transactions(wallet_address, api_key):
-    url = f"https://api.etherscan.io/api?module=account&action=tokentx&address={wallet_address}&startblock=0&endblock=99999999&sort=asc&apikey={api_key}"
-    response = requests.get(url)
-    data = response.json()
+    data = get_client(api_key).get(module='account', action='tokentx', address=wallet_address,
+                                   startblock=0, endblock=99999999, sort='asc')
     return data["result"]
 
 
-def parse_transactions(transactions, wallet_address):
-    buy_dict = defaultdict(float)
-    sell_dict = defaultdict(float)
-
-    for tx in transactions:
-        if tx['from'].lower() == wallet_address.lower():
-            # This is a sell transaction
-            if tx['tokenSymbol'] != 'ETH':
-                print(tx)
-                breakpoint()
-                sell_dict[tx['tokenSymbol']] += float(tx['value']) / 10**int(tx['tokenDecimal'])
-        elif tx['to'].lower() == wallet_address.lower():
-            # This is a buy transaction
-            if tx['tokenSymbol'] != 'ETH':
-                print(tx)
-                breakpoint()
-                buy_dict[tx['tokenSymbol']] += float(tx['value']) / 10**int(tx['tokenDecimal'])
+def get_transfers(wallet_addresses, api_key, max_workers=5):
+    """Token transfers of many wallets, fetched concurrently and synced incrementally through the local store."""
+    store = get_store(get_client(api_key))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        histories = executor.map(lambda wallet: store.get_transactions(wallet, action='tokentx', sort='asc'),
+                                 wallet_addresses)
+        return dict(zip(wallet_addresses, histories))
+
+
+def build_transfer_frame(transactions_by_wallet):
+    """One row per token transfer in or out of a wallet, keyed by token contract, with exact raw amounts."""
+    records = [tx for transactions in transactions_by_wallet.values() for tx in transactions]
+    df = pd.DataFrame.from_records(records, columns=TRANSFER_COLUMNS)
+    df['wallet'] = pd.Index([wallet_address.lower() for wallet_address in transactions_by_wallet]).repeat(
+        [len(transactions) for transactions in transactions_by_wallet.values()])
+
+    for column in ['from', 'to', 'contractAddress']:
+        df[column] = df[column].astype(str).str.lower()
+    # A transfer from the wallet is a sell, otherwise a transfer to the wallet is a buy
+    is_sell = df['from'] == df['wallet']
+    is_buy = ~is_sell & (df['to'] == df['wallet'])
+    df = df[(is_sell | is_buy) & (df['tokenSymbol'] != 'ETH')].copy()
+    df['side'] = is_sell[df.index].map({True: 'sell', False: 'buy'})
+    df['tokenDecimal'] = pd.to_numeric(df['tokenDecimal'], errors='coerce').fillna(0).astype('int64')
+
+    digits = df['value'].astype(str).str.zfill(LIMB_DIGITS * LIMB_COUNT)
+    for i, column in enumerate(LIMB_COLUMNS):
+        df[column] = digits.str.slice(i * LIMB_DIGITS, (i + 1) * LIMB_DIGITS).astype('int64')
+    return df[['wallet', 'contractAddress', 'tokenSymbol', 'tokenDecimal', 'side'] + LIMB_COLUMNS]
+
+
+def _combine_limbs(limbs):
+    """Turn summed limb columns back into exact Python integers."""
+    total = pd.Series(0, index=limbs.index, dtype=object)
+    for column in LIMB_COLUMNS:
+        total = total * 10 ** LIMB_DIGITS + limbs[column].astype(object)
+    return total
+
 
+def aggregate_transfers(df):
+    """Bought and sold raw amounts per wallet and token contract, as exact integers."""
+    sums = df.groupby(['wallet', 'contractAddress', 'side'])[LIMB_COLUMNS].sum()
+    totals = _combine_limbs(sums).unstack('side')
+    result = pd.DataFrame(index=totals.index)
+    for side, column in (('buy', 'Total Bought'), ('sell', 'Total Sold')):
+        result[column] = totals[side] if side in totals else None
+    result['Has Buy'] = result['Total Bought'].notna()
+    result = result.fillna(0)
+
+    tokens = df.groupby(['wallet', 'contractAddress'])[['tokenSymbol', 'tokenDecimal']].first()
+    result = result.join(tokens)
+    result['Win'] = result['Has Buy'] & (result['Total Sold'] > result['Total Bought'])
+    return result.reset_index()
+
+
+def score_wallets(totals, wallets=None):
+    """Number of tokens bought, wins and win ratio per wallet.
+
+    With `wallets`, every one of them gets a row in that order, with no tokens and no ratio if it has no transfers.
+    """
+    bought = totals[totals['Has Buy']]
+    scores = bought.groupby('wallet').agg(tokens_bought=('contractAddress', 'size'), wins=('Win', 'sum'))
+    index = totals['wallet'].unique() if wallets is None else list(dict.fromkeys(wallet.lower() for wallet in wallets))
+    scores = scores.reindex(index, fill_value=0)
+    scores['win_ratio'] = (scores['wins'] / scores['tokens_bought'].where(scores['tokens_bought'] > 0) * 100).round(2)
+    return scores
+
+
+def parse_transactions(transactions, wallet_address):
+    """Raw bought and sold amounts of one wallet, keyed by token contract address."""
+    totals = aggregate_transfers(build_transfer_frame({wallet_address: transactions}))
+    buy_dict = {row['contractAddress']: row['Total Bought'] for _, row in totals[totals['Has Buy']].iterrows()}
+    sell_dict = defaultdict(int, {row['contractAddress']: row['Total Sold'] for _, row in totals.iterrows()})
     return buy_dict, sell_dict
 
 
+def update_ledger(ledger, wallet_addresses, api_key):
+    """Apply to the ledger only the token transfers above each wallet's last processed block."""
+    store = get_store(get_client(api_key))
+    for wallet_address in wallet_addresses:
+        wallet_address = wallet_address.lower()
+        cursor = ledger.get_cursor(wallet_address, 'etherscan')
+        transfers = store.get_transactions(wallet_address, action='tokentx', sort='asc',
+                                           start_block=None if cursor is None else cursor + 1)
+        if not transfers:
+            continue
+        trades = []
+        for tx in transfers:
+            if tx['tokenSymbol'] == 'ETH':
+                continue
+            if tx['from'].lower() == wallet_address:
+                trades.append(Trade(tx['contractAddress'].lower(), 'sell', Decimal(int(tx['value']))))
+            elif tx['to'].lower() == wallet_address:
+                trades.append(Trade(tx['contractAddress'].lower(), 'buy', Decimal(int(tx['value']))))
+        ledger.apply(wallet_address, 'etherscan', trades, int(transfers[-1]['blockNumber']))
+
+
 def calculate_win_ratio(buy_dict, sell_dict):
     number_of_coins_bought = len(buy_dict)
     win = 0
@@ -61,7 +148,27 @@ def calculate_win_ratio(buy_dict, sell_dict):
 
 
 if __name__ == '__main__':
-    wallet_address = '0xa0ed5bCb30f4dC2574B20948cAbF84D58634b745'
-    transactions = get_transactions(wallet_address, ETHERSCAN_API_KEY)
-    buy_dict, sell_dict = parse_transactions(transactions, wallet_address)
-    calculate_win_ratio(buy_dict, sell_dict)
+    parser = argparse.ArgumentParser(description="Win ratio of wallets from their Etherscan token transfers")
+    parser.add_argument('wallets', nargs='*', default=['0xa0ed5bCb30f4dC2574B20948cAbF84D58634b745'])
+    parser.add_argument('--output', help="write the per-wallet scores to this CSV file")
+    parser.add_argument('--ledger', action='store_true',
+                        help="update the incremental PnL ledger (ledger.db) and report from it")
+    args = parser.parse_args()
+
+    if args.ledger:
+        ledger = PnLLedger()
+        update_ledger(ledger, args.wallets, ETHERSCAN_API_KEY)
+        for wallet_address in args.wallets:
+            print(wallet_address, ledger.win_ratio(wallet_address.lower(), basis='quantity'))
+    elif len(args.wallets) == 1:
+        wallet_address = args.wallets[0]
+        transactions = get_transactions(wallet_address, ETHERSCAN_API_KEY)
+        buy_dict, sell_dict = parse_transactions(transactions, wallet_address)
+        calculate_win_ratio(buy_dict, sell_dict)
+    else:
+        scores = score_wallets(aggregate_transfers(build_transfer_frame(get_transfers(args.wallets,
+                                                                                      ETHERSCAN_API_KEY))),
+                               args.wallets)
+        print(scores)
+        if args.output:
+            scores.to_csv(args.output)
@@ -1,5 +1,18 @@
-import os
+from concurrent.futures import ProcessPoolExecutor
+from pnl_ledger import PnLLedger, Trade
+from decimal import Decimal
+import pyarrow.parquet as pq
+import pyarrow as pa
 import pandas as pd
+import argparse
+import hashlib
+import json
+import os
+
+CHUNK_SIZE = 100_000
+AMOUNT_COLUMNS = ['Buy Amount', 'Sell Amount', 'Fee Amount']
+CACHED_COLUMNS = ['Buy Currency', 'Sell Currency'] + AMOUNT_COLUMNS
+TIME_COLUMNS = ['Timestamp', 'Date', 'Time']
 
 
 # Function to process each cell
@@ -13,33 +26,45 @@ def process_currency(currency):
         return split_currency[0]
 
 
-def load_and_clean_data(filepath):
-    df = pd.read_csv(filepath)
+def clean_currency(currencies):
+    """Vectorized `process_currency` over a whole column."""
+    parts = currencies.astype(str).str.split('\n')
+    first, second = parts.str[0], parts.str[1]
+    return second.where((first == 'ETH') & second.notna(), first)
+
+
+def clean_chunk(df):
     df = df[(df['Transaction Type'] == 'trade') &
             (df['Status'] == 'Confirmed') &
-            (df['Chain'] == 'ethereum')]
-
-    # ETH coin address
-    ETH_address = '0x7a250d5630b4cf539739df2c5dacb4c659f2488d'
+            (df['Chain'] == 'ethereum')].copy()
 
     # Remove any typo from the currency names
-    df['Buy Currency'] = df['Buy Currency'].apply(process_currency)
-    df['Sell Currency'] = df['Sell Currency'].apply(process_currency)
+    df['Buy Currency'] = clean_currency(df['Buy Currency'])
+    df['Sell Currency'] = clean_currency(df['Sell Currency'])
 
     # Convert the 'Buy Amount', 'Sell Amount' and 'Fee Amount' columns to float
-    for column in ['Buy Amount', 'Sell Amount', 'Fee Amount']:
+    for column in AMOUNT_COLUMNS:
         df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df
+
+
+def load_and_clean_data(filepath):
+    df = clean_chunk(pd.read_csv(filepath))
+
+    # ETH coin address
+    ETH_address = '0x7a250d5630b4cf539739df2c5dacb4c659f2488d'
 
     return df, ETH_address
 
 
-def aggregate_amounts(df, ETH_address):
-    # Aggregating buy and sell amounts for each token
+def _partial_amounts(df):
     buy_df = df[df['Sell Currency'] == 'ETH'].groupby('Buy Currency')[['Sell Amount', 'Fee Amount']].sum()
-    buy_df.columns = ['Total Bought', 'Buy Fee Amount']
+    sell_df = df[df['Buy Currency'] == 'ETH'].groupby('Sell Currency')[['Buy Amount', 'Fee Amount']].sum()
+    return buy_df, sell_df
 
-    sell_df = df[df['Buy Currency'] == 'ETH'].groupby('Sell Currency')[
-        ['Buy Amount', 'Fee Amount']].sum()
+
+def _combine_amounts(buy_df, sell_df):
+    buy_df.columns = ['Total Bought', 'Buy Fee Amount']
     sell_df.columns = ['Total Sold', 'Sell Fee Amount']
 
     # Combine both dataframes
@@ -55,37 +80,246 @@ def aggregate_amounts(df, ETH_address):
     return result
 
 
-def calculate_win_ratio(result, file_name):
-    number_of_coins_bought = len(result)
-    win = 0
+def aggregate_amounts(df, ETH_address):
+    # Aggregating buy and sell amounts for each token
+    return _combine_amounts(*_partial_amounts(df))
+
+
+def aggregate_chunks(chunks):
+    """`aggregate_amounts` of cleaned trades given chunk by chunk, holding only one chunk at a time."""
+    buy_parts, sell_parts = [], []
+    for chunk in chunks:
+        buy_df, sell_df = _partial_amounts(chunk)
+        buy_parts.append(buy_df)
+        sell_parts.append(sell_df)
+    buy_df = pd.concat(buy_parts).groupby(level=0).sum()
+    sell_df = pd.concat(sell_parts).groupby(level=0).sum()
+    return _combine_amounts(buy_df, sell_df)
+
 
-    for _, row in result.iterrows():
-        if row['Total Sold'] > (row['Total Bought'] + row['Fee Amount']):
-            win += 1
+def aggregate_file(filepath, chunk_size=CHUNK_SIZE):
+    """`aggregate_amounts` of a CSV read in chunks, so memory stays bounded for large exports."""
+    return aggregate_chunks(clean_chunk(chunk) for chunk in pd.read_csv(filepath, chunksize=chunk_size))
+
+
+def read_cache(cache_file, columns=None, chunk_size=CHUNK_SIZE):
+    """The cleaned trades of a cached export, one record batch at a time."""
+    for batch in pq.ParquetFile(cache_file).iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def compute_win_ratio(result):
+    number_of_coins_bought = len(result)
+    win = int((result['Total Sold'] > (result['Total Bought'] + result['Fee Amount'])).sum())
 
     # Check if number_of_coins_bought is not zero before calculating win_ratio
     if number_of_coins_bought != 0:
         win_ratio = str(round((win / number_of_coins_bought) * 100, 2)) + '%'
     else:
         win_ratio = 'No Token Bought'
+    return number_of_coins_bought, win, win_ratio
 
-    # print(result)
 
+def print_win_ratio(number_of_coins_bought, win, win_ratio):
     print(f'\nNumber of Tokens Bought: {number_of_coins_bought}')
     print(f'Number of Win: {win}')
     print(f'Win Ratio: {win_ratio}')
 
+
+def calculate_win_ratio(result, file_name):
+    print_win_ratio(*compute_win_ratio(result))
+
     result.to_csv(f'csv/results/{file_name}.csv')
 
 
-if __name__ == "__main__":
-    folder_path = '/Users/kendhalaltay/Desktop/Kendhal/Projects/Defi/csv/'
-    files = os.listdir(folder_path)
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
-    for file_name in files:
-        if file_name not in ['.DS_Store', 'archive', 'results']:
+
+def cache_schema(columns):
+    """Arrow schema of the cached columns: amounts are floats, everything else is text."""
+    return pa.schema([(column, pa.float64() if column in AMOUNT_COLUMNS else pa.string()) for column in columns])
+
+
+def ingest_file(file_path, cache_dir, entry=None):
+    """Return the manifest entry of an export, converting it to a cleaned Parquet file if it is new or changed.
+
+    Size and mtime are compared first; the content hash is only computed when they differ.
+    """
+    stat = os.stat(file_path)
+    cache_file = os.path.join(cache_dir, f'{os.path.basename(file_path)}.parquet')
+    if entry and os.path.exists(cache_file):
+        if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry
+        digest = file_hash(file_path)
+        if entry['sha256'] == digest:
+            return {**entry, 'size': stat.st_size, 'mtime': stat.st_mtime}
+    else:
+        digest = file_hash(file_path)
+
+    # One row group per CSV chunk, written to a temporary file that replaces the cache once complete
+    writer = None
+    with open(cache_file + '.tmp', 'wb') as sink:
+        for chunk in pd.read_csv(file_path, chunksize=CHUNK_SIZE, dtype={column: str for column in TIME_COLUMNS}):
+            chunk = clean_chunk(chunk)[CACHED_COLUMNS + [column for column in TIME_COLUMNS if column in chunk]]
+            if writer is None:
+                writer = pq.ParquetWriter(sink, cache_schema(chunk.columns))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+        if writer is None:
+            pq.write_table(cache_schema(CACHED_COLUMNS).empty_table(), sink)
+        else:
+            writer.close()
+    os.replace(cache_file + '.tmp', cache_file)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest, 'cache_file': cache_file}
+
+
+def load_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(cache_dir, manifest):
+    with open(os.path.join(cache_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def analyze_file(file_path, results_dir='csv/results', cache_dir=None, entry=None):
+    """Aggregate one export, write its result CSV and return the win-ratio figures.
+
+    With a `cache_dir` the export is read from its cleaned Parquet copy, which is refreshed first if the
+    CSV changed; the (possibly updated) manifest entry is returned along with the figures.
+    """
+    if cache_dir is None:
+        result = aggregate_file(file_path)
+    else:
+        entry = ingest_file(file_path, cache_dir, entry)
+        result = aggregate_chunks(read_cache(entry['cache_file'], CACHED_COLUMNS))
+    result.to_csv(os.path.join(results_dir, f'{os.path.basename(file_path)}.csv'))
+    return compute_win_ratio(result), entry
+
+
+def analyze_folder(folder_path, results_dir='csv/results', max_workers=None, use_cache=True):
+    """Analyze every export of a folder across CPU cores, printing the results in directory order.
+
+    Cleaned exports are cached in `<folder>/cache`; only new or changed CSVs are parsed again.
+    """
+    cache_dir = os.path.join(folder_path, 'cache') if use_cache else None
+    manifest = {}
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        manifest = load_manifest(cache_dir)
+
+    files = [file_name for file_name in os.listdir(folder_path)
+             if file_name not in ['.DS_Store', 'archive', 'results', 'cache']]
+    paths = [os.path.join(folder_path, file_name) for file_name in files]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = executor.map(analyze_file, paths, [results_dir] * len(paths), [cache_dir] * len(paths),
+                                [manifest.get(file_name) for file_name in files])
+        for file_name, (figures, entry) in zip(files, outcomes):
             print('\n', file_name)
-            file_path = os.path.join(folder_path, file_name)
-            df, ETH_address = load_and_clean_data(file_path)
-            result = aggregate_amounts(df, ETH_address)
-            calculate_win_ratio(result, file_name)
+            print_win_ratio(*figures)
+            if entry is not None:
+                manifest[file_name] = entry
+
+    if cache_dir:
+        save_manifest(cache_dir, {file_name: manifest[file_name] for file_name in files if file_name in manifest})
+
+
+def load_cached_trades(folder_path):
+    """All cached exports as one frame, with a 'Wallet' column holding the export's file name."""
+    cache_dir = os.path.join(folder_path, 'cache')
+    frames = []
+    for file_name, entry in load_manifest(cache_dir).items():
+        frame = pd.read_parquet(entry['cache_file'])
+        frame['Wallet'] = file_name
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=CACHED_COLUMNS + ['Wallet'])
+
+
+def aggregate_wallets(folder_path):
+    """Tokens bought, wins and win ratio of every cached wallet in one query, without reading any CSV."""
+    df = load_cached_trades(folder_path)
+    bought = df[df['Sell Currency'] == 'ETH'].groupby(['Wallet', 'Buy Currency'])[['Sell Amount', 'Fee Amount']].sum()
+    sold = df[df['Buy Currency'] == 'ETH'].groupby(['Wallet', 'Sell Currency'])[['Buy Amount', 'Fee Amount']].sum()
+    bought.index.names = sold.index.names = ['Wallet', 'Token']
+    bought.columns = ['Total Bought', 'Buy Fee Amount']
+    sold.columns = ['Total Sold', 'Sell Fee Amount']
+
+    tokens = pd.concat([bought, sold], axis=1)
+    fees = tokens['Buy Fee Amount'].fillna(0) + tokens['Sell Fee Amount'].fillna(0)
+    tokens['Win'] = tokens['Total Sold'] > (tokens['Total Bought'] + fees)
+
+    wallets = tokens.groupby(level='Wallet').agg(tokens_bought=('Win', 'size'), wins=('Win', 'sum'))
+    wallets['win_ratio'] = (wallets['wins'] / wallets['tokens_bought'] * 100).round(2)
+    return wallets
+
+
+def trade_timestamps(df):
+    """Unix timestamps of the trades, from the 'Timestamp' or 'Date'/'Time' columns (None if neither exists)."""
+    if 'Timestamp' in df:
+        times = pd.to_datetime(df['Timestamp'], errors='coerce', utc=True)
+    elif 'Date' in df:
+        dates = df['Date'].astype(str) + (' ' + df['Time'].astype(str) if 'Time' in df else '')
+        times = pd.to_datetime(dates, errors='coerce', utc=True)
+    else:
+        return None
+    return (times - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+
+
+def update_ledger(ledger, folder_path):
+    """Apply to the ledger only the cached trades newer than each wallet's last processed timestamp."""
+    for file_name, entry in load_manifest(os.path.join(folder_path, 'cache')).items():
+        df = pd.read_parquet(entry['cache_file'])
+        timestamps = trade_timestamps(df)
+        if timestamps is None:
+            print(f'{file_name}: no trade timestamps, skipped')
+            continue
+        df = df.assign(timestamp=timestamps).dropna(subset=['timestamp'])
+        cursor = ledger.get_cursor(file_name, 'zerion')
+        if cursor is not None:
+            df = df[df['timestamp'] > cursor]
+        if df.empty:
+            continue
+        df = df.sort_values('timestamp', kind='stable')
+
+        # Buying a token spends ETH (Sell Amount), selling it receives ETH (Buy Amount)
+        is_buy = df['Sell Currency'] == 'ETH'
+        df = df[is_buy | (df['Buy Currency'] == 'ETH')].fillna({column: 0 for column in AMOUNT_COLUMNS})
+        is_buy = is_buy[df.index]
+        token = df['Buy Currency'].where(is_buy, df['Sell Currency'])
+        quantity = df['Buy Amount'].where(is_buy, df['Sell Amount'])
+        value = df['Sell Amount'].where(is_buy, df['Buy Amount'])
+        trades = [Trade(*fields) for fields in zip(token, is_buy.map({True: 'buy', False: 'sell'}),
+                                                   quantity.map(lambda amount: Decimal(str(amount))),
+                                                   value, df['Fee Amount'])]
+        ledger.apply(file_name, 'zerion', trades, int(timestamps.max()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Win ratio of Zerion CSV exports")
+    parser.add_argument('folder', nargs='?', default='/Users/kendhalaltay/Desktop/Kendhal/Projects/Defi/csv/')
+    parser.add_argument('--workers', type=int, help="number of worker processes (default: CPU count)")
+    parser.add_argument('--no-cache', action='store_true', help="parse every CSV instead of using the Parquet cache")
+    parser.add_argument('--summary', action='store_true',
+                        help="print the win ratio of every cached wallet from the cache alone")
+    parser.add_argument('--ledger', action='store_true',
+                        help="apply new cached trades to the incremental PnL ledger (ledger.db) and report from it")
+    args = parser.parse_args()
+
+    if args.summary:
+        print(aggregate_wallets(args.folder))
+    elif args.ledger:
+        analyze_folder(args.folder, max_workers=args.workers)
+        ledger = PnLLedger()
+        update_ledger(ledger, args.folder)
+        for file_name in load_manifest(os.path.join(args.folder, 'cache')):
+            print(file_name, ledger.win_ratio(file_name))
+    else:
+        analyze_folder(args.folder, max_workers=args.workers, use_cache=not args.no_cache)